@@ -1,8 +1,10 @@
+import json
 import random
 
 import time
 from otree.api import *
 from frisbee.otree_extension.server_instance import server
+from recording import recording_window_model, start_recording, stop_recording
 
 doc = """
 Ball catching task where participants need to catch falling balls using a paddle.
@@ -15,6 +17,8 @@ class C(BaseConstants):
     TIME_PER_ROUND = 60
     TIME_PER_ROUND_MINUTES = TIME_PER_ROUND / 60
     TIME_RESULT = 20
+    # The page sends the catches and misses since its last update every UPDATE_INTERVAL seconds
+    UPDATE_INTERVAL = 1
 
 class Subsession(BaseSubsession):
     pass
@@ -25,7 +29,14 @@ class Group(BaseGroup):
 class Player(BasePlayer):
     balls_caught = models.IntegerField(initial=0)
     balls_total = models.IntegerField(initial=0)
-    recording = models.BooleanField(initial=False)
+    # Sequence number of the last ball event applied, events the page sends again are skipped
+    last_seq = models.IntegerField(initial=0)
+    # Applied ball events as JSON, written to BallEvent when the round ends
+    event_buffer = models.LongStringField(initial='[]')
+    # Ball events the page had not sent when the round ended, as JSON
+    pending_events = models.LongStringField(blank=True)
+    # Spawns of the round as JSON [[timestamp in ms, lane, speed], ...], uploaded with the page
+    spawn_log = models.LongStringField(blank=True)
     results = models.BooleanField(initial=False)
 
     anger = models.IntegerField(
@@ -159,6 +170,16 @@ class BallGameResults(ExtraModel):
     balls_total = models.IntegerField()
     timestamp = models.StringField()
 
+class BallEvent(ExtraModel):
+    player = models.Link(Player)
+    seq = models.IntegerField()  # None for spawns
+    kind = models.StringField()  # 'spawn', 'catch' or 'miss'
+    lane = models.IntegerField()
+    speed = models.FloatField()  # px per frame when the ball spawned, was caught or left the screen
+    timestamp = models.FloatField()  # POSIX time in the browser
+
+RecordingWindow = recording_window_model(Player)
+
 # FUNCTIONS
 def record_ball_game_result(player: Player):
     BallGameResults.create(
@@ -169,10 +190,48 @@ def record_ball_game_result(player: Player):
         timestamp=str(time.time())
     )
 
+def apply_ball_events(player: Player, events):
+    # Events are applied in the order of their sequence numbers and only once, during the round only the counters
+    # and the event buffer change
+    buffer = json.loads(player.event_buffer)
+    for event in sorted(events, key=lambda event: event['seq']):
+        if event['seq'] <= player.last_seq:
+            continue
+        player.last_seq = event['seq']
+        player.balls_total += 1
+        if event['kind'] == 'catch':
+            player.balls_caught += 1
+        buffer.append([event['seq'], event['kind'], event['lane'], event['speed'], event['timestamp']])
+    player.event_buffer = json.dumps(buffer)
+
+def flush_ball_events(player: Player):
+    # All rows are inserted together when the request commits
+    for seq, kind, lane, speed, timestamp in json.loads(player.event_buffer):
+        BallEvent.create(
+            player=player,
+            seq=seq,
+            kind=kind,
+            lane=lane,
+            speed=speed,
+            timestamp=timestamp / 1000
+        )
+    player.event_buffer = '[]'
+
+def record_spawns(player: Player, spawns):
+    for timestamp, lane, speed in spawns:
+        BallEvent.create(
+            player=player,
+            kind='spawn',
+            lane=lane,
+            speed=speed,
+            timestamp=timestamp / 1000
+        )
+
 def generate_client_response(player: Player):
     return dict(
         balls_caught=player.balls_caught,
-        balls_total=player.balls_total
+        balls_total=player.balls_total,
+        seq=player.last_seq
     )
 
 
@@ -184,13 +243,13 @@ class Introduction(Page):
 @server.map_frisbee_data
 class Task(Page):
     timeout_seconds = C.TIME_PER_ROUND
+    form_model = 'player'
+    form_fields = ['pending_events', 'spawn_log']
 
     @staticmethod
     def is_displayed(player: Player):
-        if not player.recording and not player.results:
-            label = player.participant.label
-            server.start_recording(player, label)
-            player.recording = True
+        if not player.results:
+            start_recording(player)
 
         return True
 
@@ -200,8 +259,13 @@ class Task(Page):
         return dict(
             balls_caught=player.balls_caught,
             balls_total=player.balls_total,
+            last_seq=player.last_seq,
         )
 
+    @staticmethod
+    def js_vars(player: Player):
+        return dict(update_interval=C.UPDATE_INTERVAL * 1000)
+
     @staticmethod
     def live_method(player: Player, data):
         t = data['type']
@@ -209,18 +273,21 @@ class Task(Page):
         if t == 'get':
             return {player.id_in_group: generate_client_response(player)}
 
-        elif t == 'ball_caught':
-            player.balls_caught = data['balls_caught']
-            player.balls_total = data['balls_total']
+        elif t == 'update':
+            apply_ball_events(player, data['events'])
             return {player.id_in_group: generate_client_response(player)}
 
     @staticmethod
     def before_next_page(player: Player, timeout_happened):
+        pending_events = player.field_maybe_none('pending_events')
+        if pending_events:
+            apply_ball_events(player, json.loads(pending_events))
+        flush_ball_events(player)
+        spawn_log = player.field_maybe_none('spawn_log')
+        if spawn_log:
+            record_spawns(player, json.loads(spawn_log))
         record_ball_game_result(player)
-        if player.recording:
-            label = player.participant.label
-            server.stop_recording(label)
-            player.recording = False
+        stop_recording(player)
         player.results = True
 
 class Results(Page):
@@ -0,0 +1,113 @@
+"""
+Pairwise distance matrices of the series, computed in parallel and cached on disk.
+
+The matrix of a distance only depends on the series and the distance parameters, not on k or the centroid of a
+grid search combination, so it is computed once per (distance, window) and stored as .npy. The file name holds a
+digest of the series, a changed database gets new matrices instead of stale ones.
+"""
+
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from distances import (
+    SELF_DISTANCES, WINDOWED_DISTANCES, distance_function, distance_to_many_function, gak, log_gak
+)
+
+CACHE_VERSION = 1
+
+
+def series_digest(series):
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for s in series:
+        digest.update(s.name.encode())
+        digest.update(np.asarray(s.values, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir, distance, window, digest):
+    name = distance
+    if distance in WINDOWED_DISTANCES:
+        name += f"_w{window if window is not None else 'full'}"
+    return Path(cache_dir) / f"{name}_{digest[:16]}.npy"
+
+
+def matrix_rows(values, rows, distance, window, sigma):
+    """
+    Computes rows of the upper triangle of a distance matrix (in a worker process).
+
+    Returns:
+        list: (row, distances to the series from row on) of every row
+    """
+    to_many = distance_to_many_function(distance, window)
+    if to_many is not None and len({len(x) for x in values}) == 1:
+        # Equal length series: all distances of a row at once
+        stacked = np.stack(values)
+        return [(i, to_many(values[i], stacked[i + 1:]).tolist()) for i in rows]
+
+    if distance == 'gak':
+        # The self-kernels normalize every pair, compute them once per series instead of once per pair
+        log_self = [log_gak(x, x, sigma, window) for x in values]
+
+        def measure(i, j):
+            return gak(values[i], values[j], sigma, window, log_self[i], log_self[j])
+    else:
+        pair_distance = distance_function(distance, window, sigma)
+
+        def measure(i, j):
+            return pair_distance(values[i], values[j])
+
+    results = []
+    for i in rows:
+        start = i if distance in SELF_DISTANCES else i + 1
+        results.append((i, [measure(i, j) for j in range(start, len(values))]))
+    return results
+
+
+def distance_matrix(executor, series, distance, window, sigma=None, cache_dir='distance_cache', workers=1):
+    """
+    Loads the distance matrix of the series from the cache or computes and caches it.
+
+    Args:
+        executor (ProcessPoolExecutor): Pool computing the rows
+        series (list): Series of the clustering
+        distance (str): One of DISTANCES
+        window (int): Sakoe-Chiba window of the windowed distances
+        sigma (float): Kernel bandwidth of gak
+        cache_dir (str): Directory of the cached matrices
+        workers (int): Number of worker processes, the rows are split into chunks for 4 times as many
+
+    Returns:
+        numpy.ndarray: Symmetric (n, n) matrix
+    """
+    path = cache_path(cache_dir, distance, window, series_digest(series))
+    if path.exists():
+        logging.info(f"Loaded {distance} distances from {path}")
+        return np.load(path)
+
+    n = len(series)
+    values = [s.values for s in series]
+    chunks = max(1, min(n, 4 * workers))
+    # Rows get shorter towards the end of the triangle, interleaving them balances the chunks
+    futures = [
+        executor.submit(matrix_rows, values, list(range(chunk, n, chunks)), distance, window, sigma)
+        for chunk in range(chunks)
+    ]
+
+    matrix = np.zeros((n, n))
+    for future in futures:
+        for i, distances in future.result():
+            start = n - len(distances)
+            matrix[i, start:] = distances
+            matrix[start:, i] = distances
+
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.tmp.npy')
+    np.save(temp_path, matrix)
+    os.replace(temp_path, path)
+    logging.info(f"Computed {n * (n - 1) // 2} {distance} distances, cached in {path}")
+    return matrix
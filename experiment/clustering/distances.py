@@ -0,0 +1,281 @@
+"""
+Distances between heart rate series of different lengths, following dtwclust's definitions.
+
+    dtw    DTW with the symmetric2 step pattern and L1 local cost (dtwclust's dtw_basic)
+    dtw2   the same with squared local cost and the square root of the total (norm L2)
+    sbd    shape-based distance, 1 - max normalized cross-correlation
+    gak    normalized triangular global alignment kernel distance
+    lbk    LB_Keogh lower bound of dtw, the larger of both directions
+    sdtw   soft-DTW with squared local cost
+
+The window is a Sakoe-Chiba band |i - j| <= window, series whose lengths differ by more than the window have an
+infinite DTW distance. sbd and sdtw do not use it.
+
+LB_Keogh also bounds dtw and dtw2 from below for series of different lengths: every point of x is aligned with at
+least one point of y inside the band, so the sum of each point's distance to the envelope of y cannot exceed the
+DTW cost.
+
+For series of equal length, like the resampled rounds, dtw, dtw2, sbd and lbk of one series to many others are
+computed together with NumPy (the *_to_many functions).
+"""
+
+
+import math
+
+import numpy as np
+
+DISTANCES = ['dtw', 'dtw2', 'sbd', 'gak', 'lbk', 'sdtw']
+# Distances that depend on the window
+WINDOWED_DISTANCES = {'dtw', 'dtw2', 'gak', 'lbk'}
+# Distances where d(x, x) is not 0
+SELF_DISTANCES = {'sdtw'}
+
+SDTW_GAMMA = 0.01
+
+
+def local_cost(x, y, norm='L1'):
+    local = np.abs(np.subtract.outer(x, y))
+    return local ** 2 if norm == 'L2' else local
+
+
+def dtw_rows(x, ys, window=None, norm='L1'):
+    """
+    Rows of the accumulated DTW costs of x against every row of ys (symmetric2 step pattern), inf outside of the
+    window.
+
+    Each row is computed with NumPy: the steps from the previous row are plain element-wise minima, and the
+    horizontal steps within the row are a running minimum, since the cost of reaching cell j from cell l to the left
+    is the sum of the local costs in between.
+
+    Yields:
+        numpy.ndarray: (len(ys), ys.shape[1]) costs of row i
+    """
+    n, m = len(x), ys.shape[1]
+    window = max(n, m) if window is None else window
+    if abs(n - m) > window:
+        for _ in range(n):
+            yield np.full((len(ys), m), math.inf)
+        return
+
+    previous = None
+    for i in range(n):
+        start, stop = max(0, i - window), min(m, i + window + 1)
+        d = np.abs(x[i] - ys[:, start:stop])
+        if norm == 'L2':
+            d = d ** 2
+        if previous is None:
+            candidates = np.full(d.shape, math.inf)
+            candidates[:, 0] = d[:, 0]
+        else:
+            candidates = previous[:, start:stop] + d
+            if start:
+                diagonal = previous[:, start - 1:stop - 1] + 2 * d
+            else:
+                diagonal = np.concatenate((np.full((len(ys), 1), math.inf), previous[:, :stop - 1] + 2 * d[:, 1:]),
+                                          axis=1)
+            candidates = np.minimum(candidates, diagonal)
+        steps = np.cumsum(d, axis=1)
+        row = np.full((len(ys), m), math.inf)
+        row[:, start:stop] = steps + np.minimum.accumulate(candidates - steps, axis=1)
+        previous = row
+        yield row
+
+
+def dtw_cost_matrix(x, y, window=None, norm='L1'):
+    """Accumulated cost matrix of DTW of x and y."""
+    return np.array([row[0] for row in dtw_rows(x, y[None, :], window, norm)])
+
+
+def dtw_to_many(x, ys, window=None, norm='L1'):
+    """DTW of x to every row of ys, all alignments are computed together."""
+    for row in dtw_rows(x, ys, window, norm):
+        pass
+    return np.sqrt(row[:, -1]) if norm == 'L2' else row[:, -1]
+
+
+def dtw(x, y, window=None, norm='L1'):
+    return float(dtw_to_many(x, y[None, :], window, norm)[0])
+
+
+def dtw_path(x, y, window=None, norm='L1'):
+    """Warping path of x and y as (index in x, index in y) from the start to the end, None if they cannot align."""
+    cost = dtw_cost_matrix(x, y, window, norm)
+    if not math.isfinite(cost[-1, -1]):
+        return None
+    cost = cost.tolist()
+    local = local_cost(x, y, norm).tolist()
+    i, j = len(x) - 1, len(y) - 1
+    path = [(i, j)]
+    while i or j:
+        # The step that reached (i, j), the diagonal step counts the local cost twice
+        steps = []
+        if i and j:
+            steps.append((cost[i - 1][j - 1] + 2 * local[i][j], i - 1, j - 1))
+        if i:
+            steps.append((cost[i - 1][j] + local[i][j], i - 1, j))
+        if j:
+            steps.append((cost[i][j - 1] + local[i][j], i, j - 1))
+        _, i, j = min(steps, key=lambda step: step[0])
+        path.append((i, j))
+    return path[::-1]
+
+
+def envelope(y, length, window):
+    """Lower and upper envelope of y (or of every row of y) inside the band around each of length positions."""
+    size = 2 * window + 1
+    padding = [(0, 0)] * (y.ndim - 1) + [(window, max(0, length + window - y.shape[-1]))]
+    lower = np.pad(y, padding, constant_values=np.inf)
+    upper = np.pad(y, padding, constant_values=-np.inf)
+    lower = np.lib.stride_tricks.sliding_window_view(lower, size, axis=-1)[..., :length, :].min(axis=-1)
+    upper = np.lib.stride_tricks.sliding_window_view(upper, size, axis=-1)[..., :length, :].max(axis=-1)
+    return lower, upper
+
+
+def lb_keogh(x, y_envelope, norm='L1'):
+    """LB_Keogh of x and an envelope, of every row if x or the envelope have several."""
+    lower, upper = y_envelope
+    excess = np.maximum(np.maximum(x - upper, lower - x), 0)
+    if norm == 'L2':
+        return np.sqrt(np.sum(excess ** 2, axis=-1))
+    return np.sum(excess, axis=-1)
+
+
+def lbk(x, y, window):
+    if abs(len(x) - len(y)) > window:
+        return math.inf
+    return float(max(lb_keogh(x, envelope(y, len(x), window)), lb_keogh(y, envelope(x, len(y), window))))
+
+
+def lbk_to_many(x, ys, window):
+    if abs(len(x) - ys.shape[1]) > window:
+        return np.full(len(ys), math.inf)
+    return np.maximum(lb_keogh(x, envelope(ys, len(x), window)), lb_keogh(ys, envelope(x, ys.shape[1], window)))
+
+
+def sbd(x, y):
+    size = 1 << (len(x) + len(y) - 2).bit_length()
+    correlation = np.fft.irfft(np.fft.rfft(x, size) * np.conj(np.fft.rfft(y, size)), size)
+    norms = np.linalg.norm(x) * np.linalg.norm(y)
+    if norms == 0:
+        return 1.0
+    return float(1 - correlation.max() / norms)
+
+
+def sbd_to_many(x, ys):
+    size = 1 << (len(x) + ys.shape[1] - 2).bit_length()
+    correlation = np.fft.irfft(np.fft.rfft(x, size) * np.conj(np.fft.rfft(ys, size, axis=1)), size, axis=1)
+    norms = np.linalg.norm(x) * np.linalg.norm(ys, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = 1 - correlation.max(axis=1) / norms
+    return np.where(norms == 0, 1.0, distances)
+
+
+def estimate_gak_sigma(series, seed=123):
+    """Cuturi's bandwidth heuristic: median distance between points of the series times sqrt(median length)."""
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([s.values for s in series])
+    sample = rng.choice(values, size=(min(len(values), 1000), 2))
+    median_length = np.median([len(s.values) for s in series])
+    return float(np.median(np.abs(sample[:, 0] - sample[:, 1])) * math.sqrt(median_length))
+
+
+def log_gak(x, y, sigma, window=None):
+    """Logarithm of the triangular global alignment kernel."""
+    n, m = len(x), len(y)
+    triangle = max(n, m) if window is None else window + 1
+    squared = np.subtract.outer(x, y) ** 2 / (2 * sigma ** 2)
+    offsets = np.abs(np.subtract.outer(np.arange(n), np.arange(m)))
+    with np.errstate(divide='ignore'):
+        log_local = (np.log(np.clip(1 - offsets / triangle, 0, None))
+                     - (squared + np.log(2 - np.exp(-squared)))).tolist()
+
+    previous = [-math.inf] * (m + 1)
+    previous[0] = 0.0
+    for i in range(n):
+        row = [-math.inf] * (m + 1)
+        local_row = log_local[i]
+        for j in range(1, m + 1):
+            log_kernel = local_row[j - 1]
+            if log_kernel == -math.inf:
+                continue
+            a, b, c = previous[j - 1], previous[j], row[j - 1]
+            largest = max(a, b, c)
+            if largest == -math.inf:
+                continue
+            row[j] = log_kernel + largest + math.log(
+                math.exp(a - largest) + math.exp(b - largest) + math.exp(c - largest))
+        previous = row
+    return previous[m]
+
+
+def gak(x, y, sigma, window=None, log_xx=None, log_yy=None):
+    """Normalized GAK distance, the self-kernels log_xx and log_yy can be passed in if they are known."""
+    log_xy = log_gak(x, y, sigma, window)
+    log_xx = log_gak(x, x, sigma, window) if log_xx is None else log_xx
+    log_yy = log_gak(y, y, sigma, window) if log_yy is None else log_yy
+    if log_xy == -math.inf:
+        return 1.0
+    return 1 - math.exp(log_xy - (log_xx + log_yy) / 2)
+
+
+def sdtw(x, y, gamma=SDTW_GAMMA):
+    n, m = len(x), len(y)
+    local = (np.subtract.outer(x, y) ** 2).tolist()
+    previous = [0.0] + [math.inf] * m
+    for i in range(n):
+        row = [math.inf] * (m + 1)
+        local_row = local[i]
+        for j in range(1, m + 1):
+            a, b, c = -previous[j - 1] / gamma, -previous[j] / gamma, -row[j - 1] / gamma
+            largest = max(a, b, c)
+            row[j] = local_row[j - 1] - gamma * (largest + math.log(
+                math.exp(a - largest) + math.exp(b - largest) + math.exp(c - largest)))
+        previous = row
+    return previous[m]
+
+
+def distance_function(distance, window=None, sigma=None):
+    """
+    Distance between two series with the parameters of a grid search combination.
+
+    Args:
+        distance (str): One of DISTANCES
+        window (int): Sakoe-Chiba window of dtw, dtw2, gak and lbk
+        sigma (float): Kernel bandwidth of gak
+
+    Returns:
+        function: Distance of two numpy arrays
+    """
+    if distance == 'dtw':
+        return lambda x, y: dtw(x, y, window)
+    if distance == 'dtw2':
+        return lambda x, y: dtw(x, y, window, norm='L2')
+    if distance == 'sbd':
+        return sbd
+    if distance == 'gak':
+        return lambda x, y: gak(x, y, sigma, window)
+    if distance == 'lbk':
+        if window is None:
+            raise ValueError("lbk needs a window")
+        return lambda x, y: lbk(x, y, window)
+    if distance == 'sdtw':
+        return sdtw
+    raise ValueError(f"Unknown distance {distance}, use one of {', '.join(DISTANCES)}")
+
+
+def distance_to_many_function(distance, window=None):
+    """
+    Distances of one series to every row of a 2D array of equal length series, computed together.
+
+    Returns:
+        function: Distances of a numpy array to the rows of a 2D array, None for gak and sdtw
+    """
+    if distance == 'dtw':
+        return lambda x, ys: dtw_to_many(x, ys, window)
+    if distance == 'dtw2':
+        return lambda x, ys: dtw_to_many(x, ys, window, norm='L2')
+    if distance == 'sbd':
+        return sbd_to_many
+    if distance == 'lbk' and window is not None:
+        return lambda x, ys: lbk_to_many(x, ys, window)
+    return None
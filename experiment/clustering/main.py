@@ -0,0 +1,188 @@
+"""
+Grid search over time series clusterings of the heart rate series, like grid_search_clustering() of the notebook.
+
+Every combination of method, distance, k and centroid is clustered and validated against the task of each series.
+The distance matrices dominate the cost and do not depend on k or the centroid, so each distance is computed once,
+in parallel, and cached on disk. The combinations are then spread over the same process pool.
+"""
+
+
+import csv
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+from distance_matrix import distance_matrix
+from distances import DISTANCES, WINDOWED_DISTANCES, estimate_gak_sigma
+from partition import CENTROIDS, METHODS, cluster
+from series import load_series
+from validation import validity_indices
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(message)s',
+    handlers=[
+        logging.FileHandler('clustering.log'),
+        logging.StreamHandler()
+    ]
+)
+
+DATABASE = os.path.join('..', 'recordings', 'final_merged.sqlite3')
+STORE = os.path.join('..', 'recordings', 'resampled_series.npy')
+K_RANGE = [2, 3, 4]
+WINDOW_SIZE = 20
+SEED = 123
+RESULT_COLUMNS = ['method', 'distance', 'centroid', 'k', 'silhouette', 'davies_bouldin', 'calinski_harabasz',
+                  'adjusted_rand_index', 'accuracy', 'iterations', 'pruned_distances', 'error', 'error_message']
+# Index -> whether higher values are better
+INDICES = {
+    'silhouette': True,
+    'calinski_harabasz': True,
+    'davies_bouldin': False,
+    'adjusted_rand_index': True,
+    'accuracy': True,
+}
+
+
+def run_combination(values, truth, matrix, method, distance, centroid, k, window, sigma, seed):
+    """
+    Clusters and validates one combination (in a worker process).
+
+    Errors are reported in the result instead of raised, like the notebook's tryCatch.
+
+    Returns:
+        dict: One row of the results
+    """
+    row = {'method': method, 'distance': distance, 'centroid': centroid, 'k': k}
+    try:
+        clustering = cluster(values, matrix, method, centroid, k, distance, window, sigma, seed)
+        row.update(validity_indices(matrix, clustering, truth))
+        row.update(iterations=clustering.iterations, pruned_distances=clustering.pruned,
+                   error=False, error_message=None)
+    except Exception as e:
+        row.update(error=True, error_message=str(e))
+    return row
+
+
+def grid_search_clustering(series, k_range=None, methods=None, distances=None, centroids=None,
+                           window=WINDOW_SIZE, max_workers=None, cache_dir='distance_cache', seed=SEED):
+    """
+    Runs the grid search.
+
+    Args:
+        series (list): Series of the clustering
+        k_range (list): Numbers of clusters (default: K_RANGE)
+        methods (list): Clustering methods (default: partitional, like the notebook)
+        distances (list): Distances (default: all DISTANCES)
+        centroids (dict): Centroids per method (default: CENTROIDS)
+        window (int): Sakoe-Chiba window of the windowed distances
+        max_workers (int): Number of worker processes (default: number of CPUs)
+        cache_dir (str): Directory of the cached distance matrices
+        seed (int): Seed of the initial centroids of every combination
+
+    Returns:
+        list: One result row per combination
+    """
+    k_range = k_range or K_RANGE
+    methods = methods or ['partitional']
+    distances = distances or DISTANCES
+    centroids = centroids or CENTROIDS
+    workers = max_workers or os.cpu_count() or 1
+
+    values = [s.values for s in series]
+    truth = [s.task for s in series]
+    sigma = estimate_gak_sigma(series, seed) if 'gak' in distances else None
+    combinations = [
+        (method, distance, centroid, k)
+        for method in methods
+        for distance, k, centroid in product(distances, k_range, centroids.get(method, []))
+    ]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        matrices = {}
+        for distance in distances:
+            started = time.monotonic()
+            matrices[distance] = distance_matrix(
+                executor, series, distance, window if distance in WINDOWED_DISTANCES else None, sigma,
+                cache_dir, workers
+            )
+            logging.info(f"{distance} distance matrix ready after {time.monotonic() - started:.1f} s")
+
+        futures = [
+            executor.submit(run_combination, values, truth, matrices[distance], method, distance, centroid, k,
+                            window, sigma, seed)
+            for method, distance, centroid, k in combinations
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            results.append(future.result())
+            logging.info(f"Finished {done} of {len(futures)} combinations")
+
+    results.sort(key=lambda row: (row['method'], DISTANCES.index(row['distance']), row['centroid'], row['k']))
+    return results
+
+
+def write_results(results, output_path):
+    with open(output_path, 'w', newline='', encoding='utf-8') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=RESULT_COLUMNS, restval=None)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def log_best_combinations(results):
+    """Logs the top 3 combinations of every index, like analyze_clustering_results() of the notebook."""
+    successful = [row for row in results if not row['error']]
+    for failed in (row for row in results if row['error']):
+        logging.warning(f"Failed {failed['method']} {failed['distance']} {failed['centroid']} k={failed['k']}: "
+                        f"{failed['error_message']}")
+
+    for index, higher_is_better in INDICES.items():
+        scored = [row for row in successful if row[index] is not None and math.isfinite(row[index])]
+        scored.sort(key=lambda row: row[index], reverse=higher_is_better)
+        logging.info(f"Top 3 by {index}:")
+        for row in scored[:3]:
+            logging.info(f"  {row['method']} {row['distance']} {row['centroid']} k={row['k']}: {row[index]:.4f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Grid search over time series clusterings of the task rounds')
+    parser.add_argument('-d', '--database', default=DATABASE,
+                        help=f'final merged database (default: {DATABASE})')
+    parser.add_argument('-s', '--store', default=STORE,
+                        help=f'resampled rounds written by recordings/main.py (default: {STORE})')
+    parser.add_argument('-k', type=int, nargs='+', default=K_RANGE,
+                        help=f'numbers of clusters (default: {" ".join(map(str, K_RANGE))})')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=['partitional'],
+                        help='clustering methods (default: partitional)')
+    parser.add_argument('--distances', nargs='+', choices=DISTANCES, default=DISTANCES,
+                        help='distances (default: all)')
+    parser.add_argument('--centroids', nargs='+', choices=sorted({c for cs in CENTROIDS.values() for c in cs}),
+                        default=None, help='centroids of the partitional method (default: pam dba)')
+    parser.add_argument('--window', type=int, default=WINDOW_SIZE,
+                        help=f'Sakoe-Chiba window of dtw, dtw2, gak and lbk (default: {WINDOW_SIZE})')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-c', '--cache-dir', default='distance_cache',
+                        help='directory of the cached distance matrices (default: distance_cache)')
+    parser.add_argument('-o', '--output', default='clustering_results.csv',
+                        help='CSV file of the results (default: clustering_results.csv)')
+
+    args = parser.parse_args()
+    centroids = None
+    if args.centroids:
+        centroids = dict(CENTROIDS, partitional=args.centroids)
+
+    series = load_series(args.database, args.store)
+    logging.info(f"Loaded {len(series)} series from {args.store}")
+    results = grid_search_clustering(series, k_range=args.k, methods=args.methods, distances=args.distances,
+                                     centroids=centroids, window=args.window, max_workers=args.workers,
+                                     cache_dir=args.cache_dir)
+    write_results(results, args.output)
+    log_best_combinations(results)
+    logging.info(f"Results: {args.output}")
@@ -0,0 +1,223 @@
+"""
+Clustering algorithms of the grid search, like dtwclust's tsclust().
+
+    partitional + pam   k-medoids on the distance matrix
+    partitional + dba   k-means with DTW barycenter averaging centroids, series are assigned with the distance
+                        of the combination
+    hierarchical + pam  average linkage on the distance matrix, the clusters are represented by their medoids
+
+Assigning series to DBA centroids is the only step that needs distances outside of the cached matrix. For dtw and
+dtw2 the centroids are visited in order of their LB_Keogh bound and the DTW of a centroid is skipped once its
+bound exceeds the best distance found so far.
+"""
+
+
+import logging
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from distances import distance_function, dtw_path, envelope, lb_keogh
+
+METHODS = ['partitional', 'hierarchical']
+CENTROIDS = {
+    'partitional': ['pam', 'dba'],
+    'hierarchical': ['pam'],
+}
+ITER_MAX = 100
+# Distances that LB_Keogh bounds from below, with the norm of their local cost
+LB_KEOGH_NORMS = {'dtw': 'L1', 'dtw2': 'L2'}
+
+
+@dataclass
+class Clustering:
+    labels: np.ndarray  # cluster of every series, 0 to k - 1
+    own_distances: np.ndarray  # distance of every series to its centroid
+    centroid_distances: np.ndarray  # (k, k) distances between the centroids
+    global_distances: np.ndarray  # distance of every centroid to the centroid of all series
+    iterations: int = 0
+    pruned: int = 0  # centroid distances skipped thanks to LB_Keogh
+
+
+def medoid(matrix, members):
+    return members[np.argmin(matrix[np.ix_(members, members)].sum(axis=1))]
+
+
+def medoid_clustering(matrix, medoids, iterations=0):
+    medoids = np.asarray(medoids)
+    labels = np.argmin(matrix[:, medoids], axis=1)
+    # A medoid belongs to its own cluster even if another medoid is as close
+    labels[medoids] = np.arange(len(medoids))
+    overall = medoid(matrix, np.arange(len(matrix)))
+    return Clustering(
+        labels=labels,
+        own_distances=matrix[np.arange(len(matrix)), medoids[labels]],
+        centroid_distances=matrix[np.ix_(medoids, medoids)],
+        global_distances=matrix[medoids, overall],
+        iterations=iterations,
+    )
+
+
+def pam(matrix, k, rng):
+    n = len(matrix)
+    medoids = rng.choice(n, size=k, replace=False)
+    for iteration in range(1, ITER_MAX + 1):
+        labels = np.argmin(matrix[:, medoids], axis=1)
+        labels[medoids] = np.arange(k)
+        new_medoids = medoids.copy()
+        for cluster in range(k):
+            members = np.flatnonzero(labels == cluster)
+            new_medoids[cluster] = medoid(matrix, members)
+        if np.array_equal(new_medoids, medoids):
+            return medoid_clustering(matrix, medoids, iteration)
+        medoids = new_medoids
+    return medoid_clustering(matrix, medoids, ITER_MAX)
+
+
+def hierarchical(matrix, k):
+    """Average linkage (UPGMA), merging the closest clusters until k are left."""
+    n = len(matrix)
+    linkage = matrix.astype(float).copy()
+    np.fill_diagonal(linkage, math.inf)
+    sizes = np.ones(n)
+    clusters = {i: [i] for i in range(n)}
+    active = np.ones(n, dtype=bool)
+
+    while len(clusters) > k:
+        masked = np.where(np.outer(active, active), linkage, math.inf)
+        a, b = np.unravel_index(np.argmin(masked), masked.shape)
+        # The merged cluster takes the place of a, its distances are the size weighted average (Lance-Williams)
+        linkage[a] = (sizes[a] * linkage[a] + sizes[b] * linkage[b]) / (sizes[a] + sizes[b])
+        linkage[:, a] = linkage[a]
+        linkage[a, a] = math.inf
+        sizes[a] += sizes[b]
+        active[b] = False
+        clusters[a].extend(clusters.pop(b))
+
+    medoids = [medoid(matrix, np.array(members)) for members in clusters.values()]
+    return medoid_clustering(matrix, medoids)
+
+
+class CentroidAssigner:
+    """Assigns series to their nearest centroid, pruning DTW computations with LB_Keogh."""
+
+    def __init__(self, distance, window, sigma):
+        self.measure = distance_function(distance, window, sigma)
+        self.norm = LB_KEOGH_NORMS.get(distance) if window is not None else None
+        self.window = window
+        self.pruned = 0
+
+    def assign(self, values, centroids):
+        labels = np.zeros(len(values), dtype=int)
+        own_distances = np.zeros(len(values))
+        envelopes = {}
+        for i, x in enumerate(values):
+            order = range(len(centroids))
+            bounds = None
+            if self.norm is not None:
+                bounds = []
+                for c, centroid in enumerate(centroids):
+                    if (c, len(x)) not in envelopes:
+                        envelopes[c, len(x)] = envelope(centroid, len(x), self.window)
+                    bounds.append(lb_keogh(x, envelopes[c, len(x)], self.norm))
+                order = np.argsort(bounds)
+
+            best, best_centroid = math.inf, 0
+            for position, c in enumerate(order):
+                if bounds is not None and bounds[c] >= best:
+                    # The remaining centroids have even larger bounds
+                    self.pruned += len(centroids) - position
+                    break
+                d = self.measure(x, centroids[c])
+                if d < best:
+                    best, best_centroid = d, c
+            labels[i] = best_centroid
+            own_distances[i] = best
+        return labels, own_distances
+
+
+def dba_step(centroid, members, window, norm):
+    """One DTW barycenter averaging step: every point of the centroid becomes the mean of the points aligned to it."""
+    sums = np.zeros(len(centroid))
+    counts = np.zeros(len(centroid))
+    for x in members:
+        path = dtw_path(centroid, x, window, norm)
+        if path is None:
+            continue
+        path = np.array(path)
+        np.add.at(sums, path[:, 0], x[path[:, 1]])
+        np.add.at(counts, path[:, 0], 1)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), centroid)
+
+
+def dba(values, matrix, k, rng, distance, window, sigma):
+    """
+    k-means with DBA centroids.
+
+    Every iteration refines the centroids by one DBA step instead of averaging them to convergence, the next
+    assignment starts from the refined centroids anyway. It stops once the assignments do not change.
+    """
+    n = len(values)
+    norm = LB_KEOGH_NORMS.get(distance, 'L1')
+    assigner = CentroidAssigner(distance, window, sigma)
+    centroids = [values[i] for i in rng.choice(n, size=k, replace=False)]
+    labels = None
+
+    for iteration in range(1, ITER_MAX + 1):
+        new_labels, own_distances = assigner.assign(values, centroids)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = [values[i] for i in np.flatnonzero(labels == cluster)]
+            if members:
+                centroids[cluster] = dba_step(centroids[cluster], members, window, norm)
+            else:
+                # Start an empty cluster again from a random series
+                centroids[cluster] = values[rng.integers(n)]
+
+    overall = values[medoid(matrix, np.arange(n))]
+    return Clustering(
+        labels=labels,
+        own_distances=own_distances,
+        centroid_distances=np.array([[assigner.measure(a, b) for b in centroids] for a in centroids]),
+        global_distances=np.array([assigner.measure(centroid, overall) for centroid in centroids]),
+        iterations=iteration,
+        pruned=assigner.pruned,
+    )
+
+
+def cluster(values, matrix, method, centroid, k, distance, window, sigma, seed):
+    """
+    Runs one grid search combination.
+
+    Args:
+        values (list): Series as numpy arrays
+        matrix (numpy.ndarray): Distance matrix of the series
+        method (str): One of METHODS
+        centroid (str): One of CENTROIDS[method]
+        k (int): Number of clusters
+        distance (str): Distance of the combination
+        window (int): Sakoe-Chiba window
+        sigma (float): Kernel bandwidth of gak
+        seed (int): Seed of the initial centroids
+
+    Returns:
+        Clustering: Assignments and centroid distances
+    """
+    if not 1 < k < len(values):
+        raise ValueError(f"k must be between 2 and {len(values) - 1}")
+    if centroid not in CENTROIDS.get(method, []):
+        raise ValueError(f"Centroid {centroid} is not supported for {method} clustering")
+
+    rng = np.random.default_rng(seed)
+    if method == 'hierarchical':
+        return hierarchical(matrix, k)
+    if centroid == 'pam':
+        return pam(matrix, k, rng)
+
+    result = dba(values, matrix, k, rng, distance, window, sigma)
+    if result.pruned:
+        logging.debug(f"LB_Keogh pruned {result.pruned} {distance} distances of dba with k={k}")
+    return result
@@ -0,0 +1,57 @@
+"""
+Loads the heart rate series of the clustering from the resampled rounds of the recordings pipeline.
+
+Like prepare_ts_data() of the analysis notebook (data_analysis/analysis.Rmd) there is one series per participant
+(session_label), round and task. recordings/main.py resamples and z-normalizes them to equal length
+(resampled_series.py), the rows of the .npy store are memory mapped instead of read into memory.
+"""
+
+
+import sqlite3
+from dataclasses import dataclass
+
+import numpy as np
+
+# Tasks whose rounds are clustered, the task is the ground truth label
+TASKS = ['ball_task', 'math_task']
+INDEX_TABLE = 'resampled_series'
+
+
+@dataclass(frozen=True)
+class Series:
+    session_label: str
+    round_number: int
+    task: str
+    values: np.ndarray
+
+    @property
+    def name(self):
+        return f"{self.session_label} {self.round_number} {self.task}"
+
+
+def load_series(db_path, store_path, tasks=None):
+    """
+    Reads the resampled series of the tasks.
+
+    Args:
+        db_path (str): Path to the final merged database with the index of the store
+        store_path (str): Path to the .npy store of the resampled rounds
+        tasks (list): Apps whose rounds are loaded (default: TASKS)
+
+    Returns:
+        list: Series ordered by task, session_label and round
+    """
+    tasks = tasks or TASKS
+    store = np.load(store_path, mmap_mode='r')
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(f"""
+            SELECT row, session_code || '_' || label, round_number, task
+            FROM {INDEX_TABLE}
+            WHERE task IN ({', '.join('?' for _ in tasks)})
+            ORDER BY task, session_code, label, round_number
+        """, tasks).fetchall()
+    finally:
+        conn.close()
+
+    return [Series(session_label, round_number, task, store[row]) for row, session_label, round_number, task in rows]
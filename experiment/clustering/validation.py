@@ -0,0 +1,98 @@
+"""
+Cluster validity indices of the grid search, like dtwclust's cvi() and the ground truth checks of the notebook.
+
+Silhouette uses the distance matrix, Davies-Bouldin and Calinski-Harabasz use the distances to the centroids of the
+clustering (the medoids for pam) and, for Calinski-Harabasz, to the medoid of all series.
+"""
+
+
+import numpy as np
+
+
+def silhouette(matrix, labels, k):
+    one_hot = np.eye(k)[labels]
+    sizes = one_hot.sum(axis=0)
+    sums = matrix @ one_hot
+    own = np.arange(len(labels)), labels
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = (sums[own] - np.diag(matrix)) / (sizes[labels] - 1)
+        mean_to_clusters = sums / sizes
+    mean_to_clusters[:, sizes == 0] = np.inf
+    mean_to_clusters[own] = np.inf
+    b = mean_to_clusters.min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        widths = (b - a) / np.maximum(a, b)
+    # Series alone in their cluster have a silhouette of 0
+    widths[sizes[labels] == 1] = 0
+    return float(np.mean(widths))
+
+
+def davies_bouldin(clustering):
+    k = len(clustering.centroid_distances)
+    scatter = np.array([
+        clustering.own_distances[clustering.labels == c].mean() if np.any(clustering.labels == c) else np.nan
+        for c in range(k)
+    ])
+    with np.errstate(divide='ignore'):
+        ratios = (scatter[:, None] + scatter[None, :]) / clustering.centroid_distances
+    np.fill_diagonal(ratios, -np.inf)
+    return float(ratios.max(axis=1).mean())
+
+
+def calinski_harabasz(clustering):
+    n = len(clustering.labels)
+    k = len(clustering.centroid_distances)
+    sizes = np.bincount(clustering.labels, minlength=k)
+    between = np.sum(sizes * clustering.global_distances ** 2) / (k - 1)
+    within = np.sum(clustering.own_distances ** 2) / (n - k)
+    return float(between / within)
+
+
+def adjusted_rand_index(labels, truth):
+    _, labels = np.unique(labels, return_inverse=True)
+    _, truth = np.unique(truth, return_inverse=True)
+    contingency = np.zeros((labels.max() + 1, truth.max() + 1))
+    np.add.at(contingency, (labels, truth), 1)
+
+    def pairs(counts):
+        return np.sum(counts * (counts - 1) / 2)
+
+    index = pairs(contingency)
+    rows, columns = pairs(contingency.sum(axis=1)), pairs(contingency.sum(axis=0))
+    expected = rows * columns / pairs(np.array(len(labels)))
+    maximum = (rows + columns) / 2
+    if maximum == expected:
+        return 1.0
+    return float((index - expected) / (maximum - expected))
+
+
+def accuracy(labels, truth, k):
+    """Share of series in the cluster numbered like their task, for k = 2 also with the numbers swapped."""
+    _, truth = np.unique(truth, return_inverse=True)
+    if k == 2:
+        return float(max(np.mean(labels == truth), np.mean(labels == 1 - truth)))
+    return float(np.mean(labels == truth))
+
+
+def validity_indices(matrix, clustering, truth):
+    """
+    Computes all indices of one clustering.
+
+    Args:
+        matrix (numpy.ndarray): Distance matrix of the series
+        clustering (Clustering): Result of the clustering
+        truth (list): Task of every series
+
+    Returns:
+        dict: silhouette, davies_bouldin, calinski_harabasz, adjusted_rand_index and accuracy, None if undefined
+    """
+    k = len(clustering.centroid_distances)
+    indices = {
+        'silhouette': silhouette(matrix, clustering.labels, k),
+        'davies_bouldin': davies_bouldin(clustering),
+        'calinski_harabasz': calinski_harabasz(clustering),
+        'adjusted_rand_index': adjusted_rand_index(clustering.labels, truth),
+        'accuracy': accuracy(clustering.labels, truth, k),
+    }
+    return {name: value if np.isfinite(value) else None for name, value in indices.items()}
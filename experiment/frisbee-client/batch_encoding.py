@@ -0,0 +1,148 @@
+"""
+Compact batch encodings for SENSOR_DATA_POINTS messages.
+
+The JSON encoding serializes every sample's sensor dict into a string and then encodes the whole batch again.
+The columnar encoding packs a batch into a single binary websocket frame instead:
+
+    header        magic b'FB', version, flags, sample count, base time (int64 µs since epoch),
+                  time sent (int32 µs relative to base)
+    time deltas   count * int32   µs relative to base time
+    heart_rate    count * uint16
+    rr counts     count * uint8   number of rr intervals per sample
+    rr intervals  sum(rr counts) * uint16 (ms), flattened in sample order
+    hrv           only if flags has FLAG_HRV: beats (uint16), mean_hr, sdnn, rmssd (float32, NaN if unknown)
+                  of the rolling HRV attached to the last sample
+
+All values are little endian. Only samples carrying an integer heart rate and a list of rr intervals can be
+encoded, other batches (e.g. rows from a CSV file) fall back to JSON.
+"""
+
+
+import math
+import struct
+from collections.abc import Sequence
+
+from rolling_hrv import HRV_KEY
+
+JSON_ENCODING = 'json'
+COLUMNAR_ENCODING = 'columnar'
+SUPPORTED_ENCODINGS = [COLUMNAR_ENCODING, JSON_ENCODING]
+
+COLUMNAR_MAGIC = b'FB'
+COLUMNAR_VERSION = 1
+COLUMNAR_HEADER = struct.Struct('<2sBBHqi')
+COLUMNAR_HRV = struct.Struct('<Hfff')
+FLAG_HRV = 0x01
+HRV_VALUES = ['mean_hr', 'sdnn', 'rmssd']
+
+_UINT8_MAX = 0xFF
+_UINT16_MAX = 0xFFFF
+_INT32_MAX = 0x7FFFFFFF
+
+
+def to_epoch_us(timestamp: float) -> int:
+    return round(timestamp * 1_000_000)
+
+
+def _rr_intervals(data: dict) -> list[int]:
+    rr_intervals = data.get('rr_intervals')
+    if not rr_intervals:
+        # The random data generator sends 0 for "no rr intervals".
+        return []
+    return list(rr_intervals)
+
+
+def can_encode_columnar(samples: Sequence[tuple[dict, float]]) -> bool:
+    """Check whether a batch of (data, time_recorded) samples fits into the columnar layout."""
+    if not samples or len(samples) > _UINT16_MAX:
+        return False
+
+    base_us = to_epoch_us(samples[0][1])
+    for data, time_recorded in samples:
+        heart_rate = data.get('heart_rate')
+        if not isinstance(heart_rate, int) or not 0 <= heart_rate <= _UINT16_MAX:
+            return False
+        rr_intervals = data.get('rr_intervals')
+        if rr_intervals and not isinstance(rr_intervals, (list, tuple)):
+            return False
+        rr_intervals = _rr_intervals(data)
+        if len(rr_intervals) > _UINT8_MAX:
+            return False
+        if not all(isinstance(rr, int) and 0 <= rr <= _UINT16_MAX for rr in rr_intervals):
+            return False
+        if abs(to_epoch_us(time_recorded) - base_us) > _INT32_MAX:
+            return False
+    return True
+
+
+def encode_columnar_batch(samples: Sequence[tuple[dict, float]], time_sent: float) -> bytes:
+    """
+    Encode a batch of (data, time_recorded) samples into one binary frame.
+
+    Timestamps are POSIX timestamps in seconds. Call can_encode_columnar() first, values that do not fit the
+    layout raise struct.error.
+    """
+    count = len(samples)
+    base_us = to_epoch_us(samples[0][1])
+
+    deltas = [to_epoch_us(time_recorded) - base_us for _, time_recorded in samples]
+    heart_rates = [data['heart_rate'] for data, _ in samples]
+    rr_per_sample = [_rr_intervals(data) for data, _ in samples]
+    rr_counts = [len(rr_intervals) for rr_intervals in rr_per_sample]
+    rr_flat = [rr for rr_intervals in rr_per_sample for rr in rr_intervals]
+    hrv = samples[-1][0].get(HRV_KEY)
+
+    return b''.join((
+        COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, FLAG_HRV if hrv else 0, count, base_us,
+                             to_epoch_us(time_sent) - base_us),
+        struct.pack(f'<{count}i', *deltas),
+        struct.pack(f'<{count}H', *heart_rates),
+        struct.pack(f'<{count}B', *rr_counts),
+        struct.pack(f'<{len(rr_flat)}H', *rr_flat),
+        _encode_hrv(hrv) if hrv else b'',
+    ))
+
+
+def _encode_hrv(hrv: dict) -> bytes:
+    values = [math.nan if hrv.get(name) is None else hrv[name] for name in HRV_VALUES]
+    return COLUMNAR_HRV.pack(min(hrv['beats'], _UINT16_MAX), *values)
+
+
+def _decode_hrv(frame: bytes, offset: int) -> dict:
+    beats, *values = COLUMNAR_HRV.unpack_from(frame, offset)
+    hrv = {'beats': beats}
+    hrv.update((name, None if math.isnan(value) else value) for name, value in zip(HRV_VALUES, values))
+    return hrv
+
+
+def decode_columnar_batch(frame: bytes) -> dict:
+    """Decode a columnar frame back into the value of a JSON SENSOR_DATA_POINTS message (for debugging)."""
+    magic, version, flags, count, base_us, time_sent_delta = COLUMNAR_HEADER.unpack_from(frame)
+    if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+        raise ValueError(f'Unsupported columnar frame (magic={magic!r}, version={version})')
+
+    offset = COLUMNAR_HEADER.size
+    deltas = struct.unpack_from(f'<{count}i', frame, offset)
+    offset += 4 * count
+    heart_rates = struct.unpack_from(f'<{count}H', frame, offset)
+    offset += 2 * count
+    rr_counts = struct.unpack_from(f'<{count}B', frame, offset)
+    offset += count
+    rr_flat = struct.unpack_from(f'<{sum(rr_counts)}H', frame, offset)
+    offset += 2 * len(rr_flat)
+
+    data_points = []
+    rr_start = 0
+    for delta, heart_rate, rr_count in zip(deltas, heart_rates, rr_counts):
+        data_points.append({
+            'data': {'heart_rate': heart_rate, 'rr_intervals': list(rr_flat[rr_start:rr_start + rr_count])},
+            'time_recorded': (base_us + delta) / 1_000_000,
+        })
+        rr_start += rr_count
+    if flags & FLAG_HRV and data_points:
+        data_points[-1]['data'][HRV_KEY] = _decode_hrv(frame, offset)
+
+    return {
+        'data_points': data_points,
+        'time_sent': (base_us + time_sent_delta) / 1_000_000,
+    }
@@ -0,0 +1,62 @@
+"""
+Per-connection statistics of the dummy client.
+
+Used to report throughput, send latency, reconnects and failures, mainly when the client simulates a full room of
+participants.
+"""
+
+
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass(kw_only=True)
+class ConnectionStats:
+    participant_label: str
+    messages: int = 0
+    samples: int = 0
+    bytes_sent: int = 0
+    send_latency_total: float = 0.0  # seconds spent awaiting websocket.send()
+    send_latency_max: float = 0.0
+    connects: int = 0
+    reconnects: int = 0
+    error: str | None = None  # why the participant stopped, if it failed
+    started: float = field(default_factory=time.monotonic)
+
+    def record_send(self, samples: int, size: int, latency: float) -> None:
+        self.messages += 1
+        self.samples += samples
+        self.bytes_sent += size
+        self.send_latency_total += latency
+        self.send_latency_max = max(self.send_latency_max, latency)
+
+    def record_connect(self) -> None:
+        if self.connects:
+            self.reconnects += 1
+        self.connects += 1
+
+    def record_error(self, exc: BaseException) -> None:
+        self.error = f'{type(exc).__name__}: {exc}'
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        mean_latency = self.send_latency_total / self.messages if self.messages else 0.0
+        return (f'{self.participant_label:<8} '
+                f'{self.messages / elapsed:8.2f} msg/s '
+                f'{self.samples / elapsed:9.2f} samples/s '
+                f'{self.bytes_sent / elapsed / 1024:8.2f} KiB/s '
+                f'latency mean {mean_latency * 1000:7.2f} ms max {self.send_latency_max * 1000:7.2f} ms '
+                f'reconnects {self.reconnects}'
+                + (f' failed: {self.error}' if self.error else ''))
+
+
+def format_stats_report(stats: list[ConnectionStats]) -> str:
+    lines = [s.summary() for s in stats]
+    messages = sum(s.messages for s in stats)
+    samples = sum(s.samples for s in stats)
+    reconnects = sum(s.reconnects for s in stats)
+    failed = sum(1 for s in stats if s.error)
+    elapsed = max((time.monotonic() - min(s.started for s in stats)) if stats else 0.0, 1e-9)
+    lines.append(f'TOTAL    {len(stats)} connections, {messages / elapsed:.2f} msg/s, '
+                 f'{samples / elapsed:.2f} samples/s, {reconnects} reconnects, {failed} failed')
+    return '\n'.join(lines)
@@ -0,0 +1,78 @@
+"""
+Replay of recorded sensor data from CSV exports of the merged task tables (e.g. math_task_lab_run_18_12.csv).
+
+The file is read in large chunks of rows instead of one row at a time. Each row is turned into a sample with the
+data the sensor originally sent (heart_rate, rr_intervals) and the POSIX timestamp it was recorded at, so the
+producer can replay the original timing at any speed.
+"""
+
+
+import csv
+import itertools
+import json
+from collections.abc import Iterator
+from datetime import datetime, timezone
+
+REPLAY_CHUNK_ROWS = 10_000
+READ_BUFFER_BYTES = 1 << 20
+MISSING_VALUES = ('', 'NA', 'NULL', 'None')
+
+
+def parse_timestamp(value: str) -> float:
+    """Parse an ISO 8601 timestamp (naive timestamps are UTC) or a POSIX timestamp."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    timestamp = datetime.fromisoformat(value.strip())
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def parse_rr_intervals(value: str | None) -> list[int]:
+    if value is None or value in MISSING_VALUES:
+        return []
+    rr_intervals = json.loads(value)
+    if not isinstance(rr_intervals, list):
+        return []
+    return [int(rr) for rr in rr_intervals]
+
+
+def row_to_sample(row: dict[str, str]) -> tuple[dict, float] | None:
+    """Convert an exported row to (data, time_recorded), or None if it has no heart rate or time."""
+    heart_rate = row.get('heart_rate')
+    time_recorded = row.get('time_recorded_epoch') or row.get('time_recorded')
+    if heart_rate in MISSING_VALUES or heart_rate is None or time_recorded in MISSING_VALUES or time_recorded is None:
+        return None
+
+    # The task tables spell the column 'rr_intervalls'.
+    rr_intervals = row.get('rr_intervalls', row.get('rr_intervals'))
+    data = {
+        'heart_rate': int(float(heart_rate)),
+        'rr_intervals': parse_rr_intervals(rr_intervals),
+    }
+    return data, parse_timestamp(time_recorded)
+
+
+def read_replay_chunks(
+        file_path: str,
+        participant_label: str | None = None,
+        chunk_rows: int = REPLAY_CHUNK_ROWS,
+) -> Iterator[list[tuple[dict, float]]]:
+    """
+    Yield the samples of an export in chunks.
+
+    If the file has a label column, only the rows of participant_label are replayed.
+    """
+    with open(file_path, 'r', newline='', encoding='utf-8', buffering=READ_BUFFER_BYTES) as csv_file:
+        csv_reader = csv.DictReader(csv_file)
+        if participant_label is not None and 'label' not in (csv_reader.fieldnames or []):
+            participant_label = None
+
+        while rows := list(itertools.islice(csv_reader, chunk_rows)):
+            samples = [
+                row_to_sample(row) for row in rows
+                if participant_label is None or row['label'] == participant_label
+            ]
+            yield [sample for sample in samples if sample is not None]
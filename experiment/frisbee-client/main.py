@@ -8,23 +8,35 @@ It authenticates with the server, receives messages from the server, and sends s
 
 import asyncio
 import csv
-import inspect
 import json
 import logging
 import os
 import random
+import tempfile
+import time
 from collections.abc import Iterator
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import AsyncIterator
 
 import websockets
-from websockets import ConnectionClosed, ConnectionClosedError, ConnectionClosedOK, WebSocketClientProtocol
+from websockets import (
+    ConnectionClosed, ConnectionClosedError, ConnectionClosedOK, WebSocketClientProtocol, WebSocketException
+)
 
 from frisbee.dev.dummy_clients.ble_hr import run_ble_hr
 from frisbee.otree_extension.messages import MessageType, BaseMessage
 
+from batch_encoding import (
+    COLUMNAR_ENCODING, JSON_ENCODING, SUPPORTED_ENCODINGS, can_encode_columnar, encode_columnar_batch
+)
+from connection_stats import ConnectionStats, format_stats_report
+from csv_replay import read_replay_chunks
+from measurement_buffer import BLOCK, DROP_OLDEST, OVERFLOW_POLICIES, MeasurementBuffer, pump_measurements
+from rolling_hrv import RollingHRV
+from sample_scheduler import SampleScheduler
+from spool import BatchSpool
+
 PARTICIPANT_LABEL = 'Alice'
 URL = 'ws://127.0.0.1:8001'
 ADMIN_PASSWORD = 'admin'
@@ -33,6 +45,53 @@ SAMPLE_RATE_PER_SEND: int | None = None  # number of data points to send in one
 AUTO_SEND: bool = False
 FILE: str | None = None
 BLE_HR: bool = False
+ENCODING: str | None = None  # batch encoding of sensor data (set by command line argument or Frisbee Server)
+DROP_LATE: bool = False  # skip sample slots instead of catching up when the sampler falls behind
+RATE_REPORT_INTERVAL = 10  # seconds between logs of achieved vs. configured sample rate
+LOAD: int | None = None  # number of simulated participants in load generator mode
+LABELS_FILE = str(Path(__file__).resolve().parent.parent / '_rooms' / 'pretest.txt')
+STATS_REPORT_INTERVAL = 10  # seconds between connection statistics reports in load generator mode
+RECONNECT_MIN_DELAY = 0.5  # seconds before the first reconnect attempt, doubled with every failed attempt
+RECONNECT_MAX_DELAY = 30
+SPOOL_DIR = tempfile.gettempdir()  # where batches spill to when the connection is down for long
+SPOOL_MEMORY_BATCHES = 600  # batches kept in memory before spilling to a file
+SPOOL_FILE_BYTES = 100 * 1024 * 1024
+BLE_BUFFER_SIZE = 64  # BLE measurements buffered between two sends
+BLE_OVERFLOW = DROP_OLDEST  # what to do with BLE measurements when the buffer is full
+REPLAY: str | None = None  # CSV export of recorded sensor data to replay
+REPLAY_SPEED = 1.0  # playback speed of --replay, 0 replays as fast as possible
+REPLAY_MAX_BACKLOG = 10  # batches spooled ahead of the connection when replaying as fast as possible
+HRV_WINDOW: int | None = None  # beats of the rolling HRV attached to every batch, None to leave it out
+
+
+@dataclass(kw_only=True)
+class ClientSettings:
+    """Settings of one simulated participant, taken from the command line."""
+    participant_label: str = PARTICIPANT_LABEL
+    url: str = URL
+    admin_password: str = ADMIN_PASSWORD
+    send_rate: int | None = SEND_RATE
+    sample_rate_per_send: int | None = SAMPLE_RATE_PER_SEND
+    auto_send: bool = AUTO_SEND
+    file: str | None = FILE
+    ble_hr: bool = BLE_HR
+    encoding: str | None = ENCODING
+    drop_late: bool = DROP_LATE
+    spool_dir: str = SPOOL_DIR
+    ble_buffer_size: int = BLE_BUFFER_SIZE
+    ble_overflow: str = BLE_OVERFLOW
+    replay: str | None = REPLAY
+    replay_speed: float = REPLAY_SPEED
+    replay_keep_timestamps: bool = False
+    hrv_window: int | None = HRV_WINDOW
+
+
+@dataclass(kw_only=True)
+class ClientConfig:
+    """Sampling configuration of one connection, resolved from the command line and the Frisbee Server."""
+    send_rate: int | None = None
+    sample_rate_per_send: int | None = None
+    encoding: str | None = None
 
 
 @dataclass(kw_only=True)
@@ -85,11 +144,12 @@ def read_csv_data(file_path: str) -> Iterator[dict[str, str]]:
             raise
 
 
-async def auth_with_frisbee_server(websocket: WebSocketClientProtocol) -> bool:
+async def auth_with_frisbee_server(websocket: WebSocketClientProtocol, settings: ClientSettings) -> bool:
     msg_value = {
         # 'admin_username': 'admin',
-        'admin_password': ADMIN_PASSWORD,
-        'participant_label': PARTICIPANT_LABEL,
+        'admin_password': settings.admin_password,
+        'participant_label': settings.participant_label,
+        'supported_encodings': SUPPORTED_ENCODINGS,
     }
     msg = BaseMessage(type=MessageType.AUTH_CREDENTIALS, value=msg_value)
 
@@ -98,22 +158,24 @@ async def auth_with_frisbee_server(websocket: WebSocketClientProtocol) -> bool:
         auth_resp = await websocket.recv()
         auth_status = json.loads(auth_resp)
     except ConnectionClosed:
-        logger.exception(f"WebSocket connection closed unexpectedly")
-        return False
+        logger.error(f"[CLIENT] WebSocket connection closed unexpectedly during authentication")
+        raise
     else:
         if auth_status.get('value', {}).get('status') == 'success':
             logger.info(f'[FRISBEE SERVER] {auth_status}')
-            logger.info('[CLIENT] Authentication with Frisbee Server successful')
+            logger.info(f'[CLIENT] Authentication of {settings.participant_label} with Frisbee Server successful')
             return True
         else:
             logger.error(f'[FRISBEE SERVER] {auth_status}')
-            logger.error(f'[CLIENT] Authentication with Frisbee Server failed. '
+            logger.error(f'[CLIENT] Authentication of {settings.participant_label} with Frisbee Server failed. '
                          f'{auth_status.get("value", {}).get("err_msg")}')
             return False
 
 
 async def consumer_handler(
         websocket: WebSocketClientProtocol,
+        settings: ClientSettings,
+        config: ClientConfig,
         config_ready_event: asyncio.Event,
         send_msg_event: asyncio.Event,
 ) -> None:
@@ -138,21 +200,33 @@ async def consumer_handler(
                 send_msg_event.clear()
 
         elif message_type == "client_config":
-            config = message.get("value", {})
-            send_rate = config.get("send_rate")
-            sample_rate_per_send = config.get("sample_rate_per_send")
+            server_config = message.get("value", {})
+            send_rate = server_config.get("send_rate")
+            sample_rate_per_send = server_config.get("sample_rate_per_send")
+            encoding = server_config.get("encoding", JSON_ENCODING)
 
-            global SEND_RATE, SAMPLE_RATE_PER_SEND
-            if SEND_RATE is None:
-                SEND_RATE = send_rate
+            if settings.send_rate is None:
+                config.send_rate = send_rate
             else:
+                config.send_rate = settings.send_rate
                 logger.info(f"[CLIENT] Overwriting send rate {send_rate} from Frisbee Server "
-                            f"with {SEND_RATE} from command line")
-            if SAMPLE_RATE_PER_SEND is None:
-                SAMPLE_RATE_PER_SEND = sample_rate_per_send
+                            f"with {settings.send_rate} from command line")
+            if settings.sample_rate_per_send is None:
+                config.sample_rate_per_send = sample_rate_per_send
             else:
+                config.sample_rate_per_send = settings.sample_rate_per_send
                 logger.info(f"[CLIENT] Overwriting sample rate per send {sample_rate_per_send} from Frisbee Server "
-                            f"with {SAMPLE_RATE_PER_SEND} from command line")
+                            f"with {settings.sample_rate_per_send} from command line")
+            if settings.encoding is None:
+                if encoding not in SUPPORTED_ENCODINGS:
+                    logger.warning(f"[CLIENT] Unsupported encoding {encoding} from Frisbee Server. "
+                                   f"Falling back to {JSON_ENCODING}")
+                    encoding = JSON_ENCODING
+                config.encoding = encoding
+            else:
+                config.encoding = settings.encoding
+                logger.info(f"[CLIENT] Overwriting encoding {encoding} from Frisbee Server "
+                            f"with {settings.encoding} from command line")
 
             config_ready_event.set()
 
@@ -171,107 +245,411 @@ async def consumer_handler(
 
 
 async def producer_handler(
-        websocket: WebSocketClientProtocol,
+        settings: ClientSettings,
+        config: ClientConfig,
         config_ready_event: asyncio.Event,
         send_msg_event: asyncio.Event,
         hr_measurement_queue: asyncio.Queue,
+        spool: BatchSpool,
 ) -> None:
-    """Send messages to the Frisbee Server."""
+    """Sample data into the spool. Keeps sampling while the connection to the Frisbee Server is down."""
     await config_ready_event.wait()
-    msg_count = 0
-    pause_btw_sends = 1/SEND_RATE
-    pause_btw_sample = pause_btw_sends/SAMPLE_RATE_PER_SEND
-    if FILE is not None:
-        data_generator = read_csv_data(FILE)
-    elif BLE_HR:
-        async def qgen(q: asyncio.Queue) -> AsyncIterator:
-            while True:
-                yield await q.get()
-        data_generator = qgen(hr_measurement_queue)
+    # Created once per participant so the window carries over reconnects
+    hrv = RollingHRV(settings.hrv_window) if settings.hrv_window is not None else None
+    if settings.ble_hr:
+        await produce_ble_batches(settings, config, send_msg_event, hr_measurement_queue, spool, hrv)
+        return
+    if settings.replay is not None:
+        await produce_replay_batches(settings, config, send_msg_event, spool, hrv)
+        return
+
+    scheduler = SampleScheduler(config.send_rate * config.sample_rate_per_send, drop_late=settings.drop_late)
+    if settings.file is not None:
+        data_generator = read_csv_data(settings.file)
     else:
         data_generator = create_rand_value()
 
+    try:
+        await sample_batches(settings, config, send_msg_event, scheduler, data_generator, spool, hrv)
+    finally:
+        spool.close()
+        log_sample_rate(settings, scheduler)
+
+
+async def produce_ble_batches(
+        settings: ClientSettings,
+        config: ClientConfig,
+        send_msg_event: asyncio.Event,
+        hr_measurement_queue: asyncio.Queue,
+        spool: BatchSpool,
+        hrv: RollingHRV | None = None,
+) -> None:
+    """
+    Batch BLE measurements once per send interval.
+
+    The sensor sets the pace, so instead of pulling one measurement per sample slot, each batch holds whatever
+    arrived in the bounded buffer since the last one, stamped with its arrival time.
+    """
+    if settings.ble_overflow == BLOCK and hr_measurement_queue.maxsize <= 0:
+        logger.warning(f"[CLIENT] Option '--ble-overflow {BLOCK}' moves the backlog into the unbounded BLE queue, "
+                       f"memory is only bounded with '--ble-overflow {DROP_OLDEST}'")
+    buffer = MeasurementBuffer(settings.ble_buffer_size, settings.ble_overflow)
+    pump_task = asyncio.create_task(pump_measurements(hr_measurement_queue, buffer))
+    scheduler = SampleScheduler(config.send_rate, drop_late=True)
+    last_rate_report = time.monotonic()
+
+    try:
+        while True:
+            if not settings.auto_send and not send_msg_event.is_set():
+                await send_msg_event.wait()
+                scheduler.reset()
+            await scheduler.next_slot()
+            if pump_task.done():
+                logger.error(f'[CLIENT] BLE device has no more data. Shutting down ...')
+                return
+            samples = buffer.drain()
+            if samples:
+                append_batch(spool, samples, hrv)
+
+            if time.monotonic() - last_rate_report >= RATE_REPORT_INTERVAL:
+                log_buffer_stats(settings, buffer)
+                log_hrv(settings, hrv)
+                last_rate_report = time.monotonic()
+    finally:
+        pump_task.cancel()
+        spool.close()
+        log_buffer_stats(settings, buffer)
+
+
+async def sample_batches(
+        settings: ClientSettings,
+        config: ClientConfig,
+        send_msg_event: asyncio.Event,
+        scheduler: SampleScheduler,
+        data_generator: Iterator[dict],
+        spool: BatchSpool,
+        hrv: RollingHRV | None = None,
+) -> None:
+    last_rate_report = time.monotonic()
+
     while True:
-        if not AUTO_SEND:
+        if not settings.auto_send and not send_msg_event.is_set():
             await send_msg_event.wait()
-        batch = []
-        for _ in range(SAMPLE_RATE_PER_SEND):
+            # Do not catch up on the slots that passed while sending was paused.
+            scheduler.reset()
+        samples = []
+        for _ in range(config.sample_rate_per_send):
+            time_recorded = await scheduler.next_slot()
             try:
-                if inspect.isgenerator(data_generator):
-                    data = next(data_generator)
-                else:
-                    data = await anext(data_generator)
+                data = next(data_generator)
             except csv.Error:
                 # only read_csv_data generator can raise csv.Error
                 return
             except StopIteration:
                 # Only read_csv_data generator can raise StopIteration, create_rand_value is infinite.
-                logger.error(f'[CLIENT] File {FILE} has no more data and incomplete batch will not be sent. '
-                             f'Shutting down ...')
-                return
-            except StopAsyncIteration:
-                # Only qgen generator can raise StopAsyncIteration.
-                logger.error(f'[CLIENT] BLE device has no more data and incomplete batch will not be sent. '
+                logger.error(f'[CLIENT] File {settings.file} has no more data and incomplete batch will not be sent. '
                              f'Shutting down ...')
                 return
-            data_point = DataPoint(
-                data=json.dumps(data),
-                time_recorded=datetime.now(timezone.utc).isoformat()
-            )
-            batch.append(data_point.__dict__)
-            await asyncio.sleep(pause_btw_sample)
+            samples.append((data, time_recorded))
+        append_batch(spool, samples, hrv)
+
+        if time.monotonic() - last_rate_report >= RATE_REPORT_INTERVAL:
+            log_sample_rate(settings, scheduler)
+            log_hrv(settings, hrv)
+            last_rate_report = time.monotonic()
 
-        msg_value = {
-            'data_points': batch,
-            'time_sent': datetime.now(timezone.utc).isoformat()
-        }
-        msg = BaseMessage(type=MessageType.SENSOR_DATA_POINTS, value=msg_value)
 
-        logger.debug(f"[CLIENT] Sending message to Frisbee Server: {msg}. Message #{msg_count}")
+async def sender_handler(
+        websocket: WebSocketClientProtocol,
+        config: ClientConfig,
+        stats: ConnectionStats,
+        spool: BatchSpool,
+) -> None:
+    """Send spooled batches to the Frisbee Server in the order they were sampled."""
+    msg_count = 0
+    while True:
+        samples = await spool.peek()
+        if samples is None:
+            return
+
+        time_sent = time.time()
+        if config.encoding == COLUMNAR_ENCODING and can_encode_columnar(samples):
+            frame = encode_columnar_batch(samples, time_sent)
+            logger.debug(f"[CLIENT] Sending {len(samples)} data points ({len(frame)} bytes, {COLUMNAR_ENCODING}) "
+                         f"to Frisbee Server. Message #{msg_count}")
+        else:
+            msg = create_sensor_data_message(samples, time_sent)
+            frame = msg.to_json()
+            logger.debug(f"[CLIENT] Sending message to Frisbee Server: {msg}. Message #{msg_count}")
         msg_count += 1
-        await websocket.send(msg.to_json())
+        send_started = time.monotonic()
+        await websocket.send(frame)
+        stats.record_send(len(samples), len(frame), time.monotonic() - send_started)
+        spool.pop()
 
 
-async def handler() -> None:
-    config_ready_event = asyncio.Event()
-    send_msg_event = asyncio.Event()
+async def produce_replay_batches(
+        settings: ClientSettings,
+        config: ClientConfig,
+        send_msg_event: asyncio.Event,
+        spool: BatchSpool,
+        hrv: RollingHRV | None = None,
+) -> None:
+    """
+    Replay a recorded CSV export with its original timing.
+
+    At speed N the gaps between recorded samples shrink by the factor N and samples are batched once per send
+    interval. At speed 0 the file is replayed as fast as the connection takes it, in batches of
+    sample_rate_per_send. Unless --replay-keep-timestamps is set, samples are stamped with the time they are replayed.
+    """
+    period = 1 / config.send_rate
+    speed = settings.replay_speed
+    if not settings.auto_send:
+        await send_msg_event.wait()
+    start = time.monotonic()
+    start_wall = time.time()
+    next_flush = start + period
+    first_recorded = None
+    batch = []
+    replayed = 0
+
+    async def wait_while_paused() -> None:
+        nonlocal start, start_wall, next_flush
+        if settings.auto_send or send_msg_event.is_set():
+            return
+        paused_at = time.monotonic()
+        await send_msg_event.wait()
+        paused_for = time.monotonic() - paused_at
+        start += paused_for
+        start_wall += paused_for
+        next_flush += paused_for
 
-    hr_m_queue = None
-    if BLE_HR:
-        hr_m_task, hr_m_queue = await run_ble_hr(send_msg_event)
+    try:
+        for chunk in read_replay_chunks(settings.replay, settings.participant_label):
+            for data, time_recorded in chunk:
+                if first_recorded is None:
+                    first_recorded = time_recorded
+                offset = time_recorded - first_recorded
+
+                if speed > 0:
+                    due = start + offset / speed
+                    while due >= next_flush:
+                        await asyncio.sleep(max(0.0, next_flush - time.monotonic()))
+                        await wait_while_paused()
+                        if batch:
+                            append_batch(spool, batch, hrv)
+                            batch = []
+                        next_flush += period
+                    replay_time = start_wall + offset / speed
+                else:
+                    replay_time = time.time()
+
+                batch.append((data, time_recorded if settings.replay_keep_timestamps else replay_time))
+                replayed += 1
+
+                if speed <= 0 and len(batch) >= config.sample_rate_per_send:
+                    await wait_while_paused()
+                    append_batch(spool, batch, hrv)
+                    batch = []
+                    await spool.wait_for_room(REPLAY_MAX_BACKLOG)
+        if batch:
+            append_batch(spool, batch, hrv)
+    finally:
+        spool.close()
+        elapsed = time.monotonic() - start
+        logger.info(f'[CLIENT] Replayed {replayed} samples of {settings.participant_label} from {settings.replay} '
+                    f'in {elapsed:.1f} s ({replayed / max(elapsed, 1e-9):.1f} samples/s)')
+
+    if not replayed:
+        logger.error(f'[CLIENT] File {settings.replay} has no samples of {settings.participant_label}')
 
-    async with websockets.connect(URL) as ws:
-        authenticated = await auth_with_frisbee_server(ws)
+
+def append_batch(spool: BatchSpool, samples: list[tuple[dict, float]], hrv: RollingHRV | None) -> None:
+    """Spool a batch, with the rolling HRV attached to its last sample if enabled."""
+    if hrv is not None:
+        samples = hrv.annotate(samples)
+    spool.append(samples)
+
+
+def log_sample_rate(settings: ClientSettings, scheduler: SampleScheduler) -> None:
+    rate = scheduler.stats()
+    logger.info(f'[CLIENT] Sample rate of {settings.participant_label}: {rate.achieved_rate:.2f}/s achieved, '
+                f'{rate.configured_rate:.2f}/s configured '
+                f'({rate.samples} samples, {rate.late} late, {rate.dropped} dropped)')
+
+
+def log_buffer_stats(settings: ClientSettings, buffer: MeasurementBuffer) -> None:
+    depth = buffer.stats()
+    logger.info(f'[CLIENT] BLE buffer of {settings.participant_label}: depth {depth.depth}/{buffer.capacity} '
+                f'(max {depth.max_depth}), {depth.received} received, {depth.dropped} dropped, '
+                f'{depth.coalesced} coalesced')
+
+
+def log_hrv(settings: ClientSettings, hrv: RollingHRV | None) -> None:
+    if hrv is None:
+        return
+    snapshot = hrv.snapshot()
+    if snapshot.mean_hr is None:
+        return
+    variability = ''
+    if snapshot.rmssd is not None:
+        variability = f', RMSSD {snapshot.rmssd:.1f} ms, SDNN {snapshot.sdnn:.1f} ms'
+    logger.info(f'[CLIENT] HRV of {settings.participant_label} over the last {snapshot.beats} beats: '
+                f'mean HR {snapshot.mean_hr:.1f} bpm{variability}')
+
+
+def to_iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def create_sensor_data_message(samples: list[tuple[dict, float]], time_sent: float) -> BaseMessage:
+    """Build the JSON SENSOR_DATA_POINTS message from (data, time_recorded) samples."""
+    batch = [
+        DataPoint(data=json.dumps(data), time_recorded=to_iso(time_recorded)).__dict__
+        for data, time_recorded in samples
+    ]
+    msg_value = {
+        'data_points': batch,
+        'time_sent': to_iso(time_sent)
+    }
+    return BaseMessage(type=MessageType.SENSOR_DATA_POINTS, value=msg_value)
+
+
+async def connection_handler(
+        settings: ClientSettings,
+        config: ClientConfig,
+        stats: ConnectionStats,
+        config_ready_event: asyncio.Event,
+        send_msg_event: asyncio.Event,
+        spool: BatchSpool,
+) -> bool:
+    """
+    Run one connection to the Frisbee Server.
+
+    Returns True if the connection was lost unexpectedly and should be retried.
+    """
+    async with websockets.connect(settings.url) as ws:
+        authenticated = await auth_with_frisbee_server(ws, settings)
         if not authenticated:
-            return
-        consumer_task = asyncio.create_task(consumer_handler(ws, config_ready_event, send_msg_event))
-        producer_task = asyncio.create_task(producer_handler(ws, config_ready_event, send_msg_event, hr_m_queue))
+            return False
+        stats.record_connect()
+        consumer_task = asyncio.create_task(
+            consumer_handler(ws, settings, config, config_ready_event, send_msg_event)
+        )
+        sender_task = asyncio.create_task(sender_handler(ws, config, stats, spool))
 
         try:
             done, pending = await asyncio.wait(
-                [consumer_task, producer_task],
+                [consumer_task, sender_task],
                 return_when=asyncio.FIRST_COMPLETED,
             )
         except asyncio.CancelledError:
             consumer_task.cancel()
-            producer_task.cancel()
-            await asyncio.gather(consumer_task, producer_task, return_exceptions=True)
+            sender_task.cancel()
+            await asyncio.gather(consumer_task, sender_task, return_exceptions=True)
             raise
 
         else:
             for task in pending:
                 task.cancel()
 
+            connection_lost = False
             handled_exceptions = []
             for task in done:
                 exc = task.exception()
                 if exc:
+                    connection_lost |= isinstance(exc, ConnectionClosedError)
                     # Handle and log exceptions once to prevent log clutter.
                     # E.g. ConnectionClosed exceptions may be raised by both tasks.
                     exc_id = (type(exc), exc.args)
                     if exc_id not in handled_exceptions:
                         handle_exception(exc)
                         handled_exceptions.append(exc_id)
+            return connection_lost
+
+
+async def handler(settings: ClientSettings, stats: ConnectionStats) -> None:
+    """
+    Run one participant.
+
+    Sampling runs independently of the connection. When the connection is lost, samples are spooled and the client
+    reconnects and re-authenticates with exponential backoff, then replays the spooled batches in order.
+    """
+    config = ClientConfig()
+    config_ready_event = asyncio.Event()
+    send_msg_event = asyncio.Event()
+    spool = BatchSpool(
+        Path(settings.spool_dir) / f'frisbee_spool_{settings.participant_label}.jsonl',
+        max_memory_batches=SPOOL_MEMORY_BATCHES,
+        max_file_bytes=SPOOL_FILE_BYTES,
+        logger=logger,
+    )
+
+    hr_m_queue = None
+    if settings.ble_hr:
+        hr_m_task, hr_m_queue = await run_ble_hr(send_msg_event)
+
+    producer_task = asyncio.create_task(
+        producer_handler(settings, config, config_ready_event, send_msg_event, hr_m_queue, spool)
+    )
+
+    attempt = 0
+    try:
+        while True:
+            connects = stats.connects
+            try:
+                retry = await connection_handler(settings, config, stats, config_ready_event, send_msg_event, spool)
+            except ConnectionClosedOK:
+                retry = False
+            except (OSError, WebSocketException) as e:
+                # Includes rejected handshakes, e.g. HTTP 503 from an overloaded server
+                logger.error(f'[CLIENT] Connecting {settings.participant_label} to {settings.url} failed: {e}')
+                retry = True
+            if not retry or (producer_task.done() and not len(spool)):
+                break
+
+            if stats.connects > connects:
+                attempt = 0
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt) * random.uniform(0.5, 1)
+            attempt += 1
+            logger.info(f'[CLIENT] Reconnecting {settings.participant_label} in {delay:.1f} s '
+                        f'({len(spool)} batches spooled)')
+            await asyncio.sleep(delay)
+    finally:
+        producer_task.cancel()
+        await asyncio.gather(producer_task, return_exceptions=True)
+
+    if not producer_task.cancelled() and producer_task.exception():
+        handle_exception(producer_task.exception())
+
+
+async def report_stats(stats: list[ConnectionStats]) -> None:
+    while True:
+        await asyncio.sleep(STATS_REPORT_INTERVAL)
+        logger.info(f'[CLIENT] Connection statistics:\n{format_stats_report(stats)}')
+
+
+async def load_handler(participants: list[ClientSettings]) -> None:
+    """Simulate several participants in one event loop."""
+    stats = [ConnectionStats(participant_label=p.participant_label) for p in participants]
+    reporter = asyncio.create_task(report_stats(stats))
+    try:
+        # A failing participant must not cancel the others
+        results = await asyncio.gather(*(handler(p, s) for p, s in zip(participants, stats)), return_exceptions=True)
+        for participant_stats, result in zip(stats, results):
+            if isinstance(result, BaseException):
+                participant_stats.record_error(result)
+                logger.error(f'[CLIENT] Participant {participant_stats.participant_label} failed', exc_info=result)
+    finally:
+        reporter.cancel()
+        logger.info(f'[CLIENT] Final connection statistics:\n{format_stats_report(stats)}')
+
+
+def read_participant_labels(file_path: str) -> list[str]:
+    """Read the unique participant labels of a room file, in file order."""
+    with open(file_path, 'r', encoding='utf-8') as labels_file:
+        labels = [line.strip() for line in labels_file if line.strip()]
+    return list(dict.fromkeys(labels))
 
 
 def handle_exception(exc: BaseException) -> None:
@@ -303,26 +681,72 @@ def is_file_exists_and_readable(file_path: str) -> bool:
 
 
 def run(**kwargs) -> None:
-    global PARTICIPANT_LABEL, URL, ADMIN_PASSWORD, SEND_RATE, SAMPLE_RATE_PER_SEND, AUTO_SEND, FILE, BLE_HR
-    PARTICIPANT_LABEL = kwargs['participant-label']
-    URL = kwargs['url']
-    ADMIN_PASSWORD = kwargs['password']
-    SEND_RATE = kwargs['send_rate']
-    SAMPLE_RATE_PER_SEND = kwargs['sample_rate_per_send']
-    AUTO_SEND = kwargs['auto_send']
-    FILE = kwargs['file']
-    BLE_HR = kwargs['ble_hr']  # TODO make compatible with AUTO_SEND
-
-    if FILE is not None and BLE_HR:
+    settings = ClientSettings(
+        participant_label=kwargs['participant-label'],
+        url=kwargs['url'],
+        admin_password=kwargs['password'],
+        send_rate=kwargs['send_rate'],
+        sample_rate_per_send=kwargs['sample_rate_per_send'],
+        auto_send=kwargs['auto_send'],
+        file=kwargs['file'],
+        ble_hr=kwargs['ble_hr'],  # TODO make compatible with AUTO_SEND
+        encoding=kwargs['encoding'],
+        drop_late=kwargs['drop_late'],
+        spool_dir=kwargs['spool_dir'],
+        ble_buffer_size=kwargs['ble_buffer_size'],
+        ble_overflow=kwargs['ble_overflow'],
+        replay=kwargs['replay'],
+        replay_speed=kwargs['replay_speed'],
+        replay_keep_timestamps=kwargs['replay_keep_timestamps'],
+        hrv_window=kwargs['hrv_window'],
+    )
+    load = kwargs['load']
+
+    if settings.hrv_window is not None and settings.hrv_window < 2:
+        logger.error("[CLIENT] Option '--hrv-window' must be at least 2 beats.")
+        return
+
+    if load is not None and settings.ble_hr:
+        # Simulated participants have no sensors.
+        logger.info("[CLIENT] Option '--ble-hr' is ignored in load generator mode.")
+        settings.ble_hr = False
+
+    if settings.replay is not None and settings.ble_hr:
+        logger.info("[CLIENT] Option '--ble-hr' is ignored when replaying a recording.")
+        settings.ble_hr = False
+
+    if settings.file is not None and settings.replay is not None:
+        logger.error("[CLIENT] Options '--file' and '--replay' cannot be used at the same time.")
+        return
+
+    if settings.file is not None and settings.ble_hr:
         logger.error("[CLIENT] Options '--file' and '--ble-hr' cannot be used at the same time.")
         return
 
-    if FILE is not None:
-        if not is_file_exists_and_readable(FILE):
+    if settings.file is not None:
+        if not is_file_exists_and_readable(settings.file):
             return
 
+    if settings.replay is not None:
+        if not is_file_exists_and_readable(settings.replay):
+            return
+
+    if load is not None:
+        if not is_file_exists_and_readable(kwargs['labels_file']):
+            return
+        labels = read_participant_labels(kwargs['labels_file'])
+        if not 0 < load <= len(labels):
+            logger.error(f"[CLIENT] Option '--load' must be between 1 and {len(labels)}, "
+                         f"the number of participant labels in {kwargs['labels_file']}.")
+            return
+        participants = [replace(settings, participant_label=label) for label in labels[:load]]
+        logger.setLevel(logging.INFO)
+        main = load_handler(participants)
+    else:
+        main = handler(settings, ConnectionStats(participant_label=settings.participant_label))
+
     try:
-        asyncio.run(handler())
+        asyncio.run(main)
     except KeyboardInterrupt:
         logger.info('KeyboardInterrupt received. Shutting down ...')
 
@@ -338,6 +762,22 @@ if __name__ == '__main__':
     parser.add_argument('-a', '--auto-send', action='store_true', help=help_str)
     parser.add_argument('-f', '--file', type=str, default=FILE, help=help_str)
     parser.add_argument('-b', '--ble-hr', action='store_true', default=True, help=help_str)  # Changed this line
+    parser.add_argument('-R', '--replay', type=str, default=REPLAY,
+                        help='CSV export of a recorded session to replay ' + help_str)
+    parser.add_argument('-x', '--replay-speed', type=float, default=REPLAY_SPEED,
+                        help='playback speed, 0 for as fast as possible ' + help_str)
+    parser.add_argument('--replay-keep-timestamps', action='store_true', help=help_str)
+    parser.add_argument('--ble-buffer-size', type=int, default=BLE_BUFFER_SIZE, help=help_str)
+    parser.add_argument('--ble-overflow', choices=OVERFLOW_POLICIES, default=BLE_OVERFLOW,
+                        help=f'{BLOCK} only bounds memory with a bounded BLE queue ' + help_str)
+    parser.add_argument('-e', '--encoding', choices=SUPPORTED_ENCODINGS, default=ENCODING, help=help_str)
+    parser.add_argument('--hrv-window', type=int, default=HRV_WINDOW,
+                        help='attach mean HR, RMSSD and SDNN over this many beats to every batch ' + help_str)
+    parser.add_argument('-d', '--drop-late', action='store_true', help=help_str)
+    parser.add_argument('-o', '--spool-dir', default=SPOOL_DIR, help=help_str)
+    parser.add_argument('-n', '--load', type=int, default=LOAD,
+                        help='simulate this many participants in one process ' + help_str)
+    parser.add_argument('-l', '--labels-file', default=LABELS_FILE, help=help_str)
     parser.add_argument('-u', '--url', default=URL, help=help_str)
     parser.add_argument('-P', '--password', default=ADMIN_PASSWORD, help=help_str)
 
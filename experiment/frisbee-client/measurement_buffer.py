@@ -0,0 +1,105 @@
+"""
+Bounded buffer between the BLE heart rate measurements and the producer.
+
+Measurements are stamped with their arrival time when they enter the buffer, so a batch built later still carries
+the time each measurement was taken. When the buffer is full, the overflow policy decides what happens:
+
+    drop-oldest  discard the oldest buffered measurement
+    coalesce     merge the new measurement into the newest buffered one (latest heart rate, rr intervals appended)
+    block        wait for the producer to make room, measurements back up in the BLE client's own queue
+
+block only moves the backlog upstream. It keeps memory bounded only if the source queue is bounded too
+(asyncio.Queue(maxsize=...)). The BLE client's queue has no limit, so drop-oldest is the default.
+"""
+
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+
+DROP_OLDEST = 'drop-oldest'
+COALESCE = 'coalesce'
+BLOCK = 'block'
+OVERFLOW_POLICIES = [DROP_OLDEST, COALESCE, BLOCK]
+
+
+@dataclass(kw_only=True)
+class BufferStats:
+    depth: int
+    max_depth: int
+    received: int
+    dropped: int
+    coalesced: int
+
+
+def coalesce_measurements(older: dict, newer: dict) -> dict:
+    merged = {**older, **newer}
+    rr_intervals = [*(older.get('rr_intervals') or []), *(newer.get('rr_intervals') or [])]
+    if rr_intervals:
+        merged['rr_intervals'] = rr_intervals
+    return merged
+
+
+class MeasurementBuffer:
+    def __init__(self, capacity: int, overflow_policy: str = DROP_OLDEST) -> None:
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy {overflow_policy}')
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        self.max_depth = 0
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._items: deque[tuple[dict, float]] = deque()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def put(self, measurement: dict) -> None:
+        timestamp = time.time()
+        self.received += 1
+
+        if len(self._items) >= self.capacity:
+            if self.overflow_policy == DROP_OLDEST:
+                self._items.popleft()
+                self.dropped += 1
+            elif self.overflow_policy == COALESCE:
+                newest, _ = self._items[-1]
+                # Keep the newest entry's position but stamp it with the latest arrival time.
+                self._items[-1] = (coalesce_measurements(newest, measurement), timestamp)
+                self.coalesced += 1
+                return
+            else:
+                while len(self._items) >= self.capacity:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+                timestamp = time.time()
+
+        self._items.append((measurement, timestamp))
+        self.max_depth = max(self.max_depth, len(self._items))
+
+    def drain(self) -> list[tuple[dict, float]]:
+        """Take every buffered (measurement, time_recorded) pair, oldest first. Never blocks."""
+        items = list(self._items)
+        self._items.clear()
+        self._not_full.set()
+        return items
+
+    def stats(self) -> BufferStats:
+        return BufferStats(
+            depth=len(self._items),
+            max_depth=self.max_depth,
+            received=self.received,
+            dropped=self.dropped,
+            coalesced=self.coalesced,
+        )
+
+
+async def pump_measurements(queue: asyncio.Queue, buffer: MeasurementBuffer) -> None:
+    """Forward measurements from the BLE client's queue into the bounded buffer."""
+    while True:
+        measurement = await queue.get()
+        await buffer.put(measurement)
@@ -0,0 +1,85 @@
+"""
+Rolling heart rate variability over the most recent beats.
+
+Every update is O(1): the window keeps running sums of the rr intervals, their squares and the squared successive
+differences, and subtracts what falls out of the window. rr intervals are integers (ms), so the sums are exact and
+do not drift however long the client runs.
+
+The latest values are attached to the last sample of each outgoing batch under the 'hrv' key:
+
+    beats    rr intervals in the window
+    mean_hr  60000 / mean rr interval, the heart rate averaged over beats and not over samples (bpm)
+    sdnn     sample standard deviation of the rr intervals (ms)
+    rmssd    root mean square of the successive rr differences (ms)
+"""
+
+
+import math
+from collections import deque
+from dataclasses import asdict, dataclass
+
+HRV_KEY = 'hrv'
+
+
+@dataclass(kw_only=True)
+class HRVSnapshot:
+    beats: int
+    mean_hr: float | None
+    sdnn: float | None
+    rmssd: float | None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class RollingHRV:
+    def __init__(self, window_beats: int) -> None:
+        if window_beats < 2:
+            raise ValueError('The HRV window needs at least 2 beats')
+        self.window_beats = window_beats
+        self._rr: deque[int] = deque()
+        self._rr_sum = 0
+        self._rr_square_sum = 0
+        self._squared_diffs: deque[int] = deque()
+        self._squared_diff_sum = 0
+
+    def add_beat(self, rr: int) -> None:
+        if self._rr:
+            squared_diff = (rr - self._rr[-1]) ** 2
+            self._squared_diffs.append(squared_diff)
+            self._squared_diff_sum += squared_diff
+        self._rr.append(rr)
+        self._rr_sum += rr
+        self._rr_square_sum += rr * rr
+
+        if len(self._rr) > self.window_beats:
+            oldest = self._rr.popleft()
+            self._rr_sum -= oldest
+            self._rr_square_sum -= oldest * oldest
+            self._squared_diff_sum -= self._squared_diffs.popleft()
+
+    def update(self, data: dict) -> None:
+        """Add the rr intervals of one sample."""
+        # The random data generator sends 0 for "no rr intervals".
+        for rr in data.get('rr_intervals') or []:
+            if isinstance(rr, (int, float)) and rr > 0:
+                self.add_beat(int(rr))
+
+    def snapshot(self) -> HRVSnapshot:
+        beats = len(self._rr)
+        sdnn = None
+        if beats >= 2:
+            variance = (self._rr_square_sum - self._rr_sum ** 2 / beats) / (beats - 1)
+            sdnn = math.sqrt(max(variance, 0.0))
+        rmssd = math.sqrt(self._squared_diff_sum / len(self._squared_diffs)) if self._squared_diffs else None
+        mean_hr = 60000 * beats / self._rr_sum if beats else None
+        return HRVSnapshot(beats=beats, mean_hr=mean_hr, sdnn=sdnn, rmssd=rmssd)
+
+    def annotate(self, samples: list[tuple[dict, float]]) -> list[tuple[dict, float]]:
+        """Update the window with a batch and attach the resulting snapshot to the batch's last sample."""
+        if not samples:
+            return samples
+        for data, _ in samples:
+            self.update(data)
+        data, time_recorded = samples[-1]
+        return [*samples[:-1], ({**data, HRV_KEY: self.snapshot().to_dict()}, time_recorded)]
@@ -0,0 +1,87 @@
+"""
+Drift-free sample scheduling.
+
+Sleeping a fixed pause after every sample makes the effective rate drift below the configured one by the cost of each
+loop iteration. The scheduler instead targets absolute deadlines on the monotonic clock (start + n * period), so
+overhead in one iteration shortens the next sleep instead of accumulating.
+"""
+
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+
+@dataclass(kw_only=True)
+class SchedulerStats:
+    configured_rate: float
+    achieved_rate: float
+    samples: int
+    late: int
+    dropped: int
+
+
+class SampleScheduler:
+    """
+    Hand out sample slots at a fixed rate.
+
+    When the caller falls behind by one or more whole periods, the missed slots are either caught up back-to-back
+    (default) or skipped and counted as dropped. Each slot carries its scheduled wall clock time, which keeps the
+    spacing of recorded timestamps exact.
+    """
+
+    def __init__(self, rate: float, drop_late: bool = False) -> None:
+        self.period = 1 / rate
+        self.rate = rate
+        self.drop_late = drop_late
+        self.samples = 0
+        self.late = 0
+        self.dropped = 0
+        self._slot = 0
+        self._emitted = 0
+        self._start_monotonic = 0.0
+        self._last_monotonic = 0.0
+        self._start_wall = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        """Restart the schedule from now, e.g. after sending was paused."""
+        self._slot = 0
+        self._emitted = 0
+        self._start_monotonic = time.monotonic()
+        self._last_monotonic = self._start_monotonic
+        self._start_wall = time.time()
+
+    async def next_slot(self) -> float:
+        """Wait for the next deadline and return the slot's scheduled POSIX timestamp."""
+        deadline = self._start_monotonic + self._slot * self.period
+        now = time.monotonic()
+
+        if now < deadline:
+            await asyncio.sleep(deadline - now)
+        else:
+            missed = int((now - deadline) / self.period)
+            if missed and self.drop_late:
+                self.dropped += missed
+                self._slot += missed
+            elif missed:
+                self.late += 1
+
+        timestamp = self._start_wall + self._slot * self.period
+        self._slot += 1
+        self._emitted += 1
+        self._last_monotonic = time.monotonic()
+        self.samples += 1
+        return timestamp
+
+    def stats(self) -> SchedulerStats:
+        """Counters since creation, achieved rate since the last reset."""
+        elapsed = self._last_monotonic - self._start_monotonic
+        achieved_rate = (self._emitted - 1) / elapsed if elapsed > 0 else 0.0
+        return SchedulerStats(
+            configured_rate=self.rate,
+            achieved_rate=achieved_rate,
+            samples=self.samples,
+            late=self.late,
+            dropped=self.dropped,
+        )
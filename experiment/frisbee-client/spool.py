@@ -0,0 +1,121 @@
+"""
+Bounded backlog of sample batches that have not been sent to the Frisbee Server yet.
+
+Batches are kept in memory first. Once the memory limit is reached they spill to an append-only JSON lines file, and
+every later batch is appended to the file as well until it has been replayed, so batches always leave the spool in the
+order they were recorded. Batches are only removed after they have been sent (peek, then pop).
+"""
+
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+Sample = tuple[dict, float]  # sensor data and the POSIX timestamp it was recorded at
+
+
+class BatchSpool:
+    def __init__(
+            self,
+            file_path: str | Path,
+            max_memory_batches: int,
+            max_file_bytes: int,
+            logger: logging.Logger,
+    ) -> None:
+        self.logger = logger
+        self.file_path = Path(file_path)
+        self.max_memory_batches = max_memory_batches
+        self.max_file_bytes = max_file_bytes
+        self.dropped = 0
+        self.closed = False
+
+        self._memory: deque[list[Sample]] = deque()
+        self._file_batches = 0
+        self._file_size = 0
+        self._read_offset = 0
+        self._file_head: list[Sample] | None = None
+        self._available = asyncio.Event()
+        self._popped = asyncio.Event()
+
+        self._keep_stale_file()
+
+    def __len__(self) -> int:
+        return len(self._memory) + self._file_batches
+
+    def _keep_stale_file(self) -> None:
+        if self.file_path.is_file() and self.file_path.stat().st_size:
+            stale_path = self.file_path.with_name(f'{self.file_path.name}.{int(time.time())}.stale')
+            self.file_path.rename(stale_path)
+            self.logger.warning(f'[CLIENT] Unsent batches of a previous run were moved to {stale_path}')
+
+    def append(self, batch: list[Sample]) -> None:
+        if self._file_batches == 0 and len(self._memory) < self.max_memory_batches:
+            self._memory.append(batch)
+        else:
+            line = json.dumps([[data, time_recorded] for data, time_recorded in batch]) + '\n'
+            if self._file_size + len(line) > self.max_file_bytes:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 100 == 0:
+                    self.logger.warning(f'[CLIENT] Spool {self.file_path} is full, '
+                                        f'{self.dropped} batches dropped so far')
+                return
+            if self._file_batches == 0:
+                self.logger.info(f'[CLIENT] Spilling unsent batches to {self.file_path}')
+            with open(self.file_path, 'a', encoding='utf-8') as spool_file:
+                spool_file.write(line)
+            self._file_batches += 1
+            self._file_size += len(line)
+        self._available.set()
+
+    def close(self) -> None:
+        """Mark that no more batches will be appended."""
+        self.closed = True
+        self._available.set()
+
+    async def peek(self) -> list[Sample] | None:
+        """Wait for the oldest batch without removing it. Returns None once the spool is closed and empty."""
+        while not len(self):
+            if self.closed:
+                return None
+            self._available.clear()
+            await self._available.wait()
+
+        if self._memory:
+            return self._memory[0]
+        if self._file_head is None:
+            self._file_head = self._read_file_head()
+        return self._file_head
+
+    async def wait_for_room(self, max_batches: int) -> None:
+        """Wait until at most max_batches are spooled. Lets a producer that does not pace itself apply backpressure."""
+        while len(self) > max_batches:
+            self._popped.clear()
+            await self._popped.wait()
+
+    def pop(self) -> None:
+        """Remove the oldest batch after it was sent."""
+        self._popped.set()
+        if self._memory:
+            self._memory.popleft()
+            return
+
+        if self._file_head is None:
+            self._read_file_head()
+        self._file_head = None
+        self._file_batches -= 1
+        if self._file_batches == 0:
+            os.remove(self.file_path)
+            self._file_size = 0
+            self._read_offset = 0
+            self.logger.info(f'[CLIENT] Replayed all spilled batches from {self.file_path}')
+
+    def _read_file_head(self) -> list[Sample]:
+        with open(self.file_path, 'r', encoding='utf-8') as spool_file:
+            spool_file.seek(self._read_offset)
+            line = spool_file.readline()
+            self._read_offset = spool_file.tell()
+        return [(data, time_recorded) for data, time_recorded in json.loads(line)]
@@ -1,7 +1,9 @@
+import json
 import time
 
 from otree.api import *
 from frisbee.otree_extension.server_instance import server
+from recording import recording_window_model, start_recording, stop_recording
 
 import random
 
@@ -9,6 +11,8 @@ doc = """
 Math task app will make participants do equations in their head.
  The equations are randomly generated and consist of four 2-digit
  numbers which must be summed up by the participants in head.
+ The page gets the equations in seeded batches and shows the next one
+ without waiting for the server, which verifies the answers from the seed.
  No help is allowed in any form (calculator, paper etc).
  There are 5 rounds each giving 2 minutes to solve as many equations
  as possible. In the end one random round shall be picked for the payout.
@@ -22,6 +26,13 @@ class C(BaseConstants):
     TIME_PER_ROUND = 60
     TIME_PER_ROUND_MINUTES = TIME_PER_ROUND/60
     TIME_RESULT = 20
+    # The page gets equations in batches and asks for the next batch when only EQUATION_REFILL are left,
+    # its answers are sent every SUBMIT_INTERVAL seconds
+    EQUATION_BATCH = 10
+    EQUATION_REFILL = 3
+    SUBMIT_INTERVAL = 2
+    # Verified attempts are written when the round ends, or earlier once a player has this many waiting
+    ATTEMPT_FLUSH_SIZE = 20
 
 
 class Subsession(BaseSubsession):
@@ -42,7 +53,11 @@ class Player(BasePlayer):
     is_correct = models.BooleanField(initial=False)
     count_equations = models.IntegerField(initial=0)
     count_correct = models.IntegerField(initial=0)
-    recording = models.BooleanField(initial=False)
+    equation_seed = models.IntegerField()
+    # Verified attempts as JSON, waiting to be written to EquationAttempt
+    attempt_buffer = models.LongStringField(initial='[]')
+    # Answers the page could not send live any more, submitted with the page and verified when the round ends
+    pending_attempts = models.LongStringField(blank=True)
     results = models.BooleanField(initial=False)
 
     anger = models.IntegerField(
@@ -190,33 +205,58 @@ class MathRoundResults(ExtraModel):
     timestamp = models.StringField()
 
 
-# FUNCTIONS
-def generate_equation(player: Player):
-    player.n1 = random.randint(-99, 99)
-    player.n2 = random.randint(-99, 99)
-    player.n3 = random.randint(-99, 99)
-    player.n4 = random.randint(-99, 99)
-    player.ans_correct = player.n1 + player.n2 + player.n3 + player.n4
+RecordingWindow = recording_window_model(Player)
 
 
-def generate_client_response(player: Player):
-    return dict(
-            n1=player.n1,
-            n2=player.n2,
-            n3=player.n3,
-            n4=player.n4)
+# FUNCTIONS
+def generate_equation(player: Player, index):
+    # Equation number index of the player, the same seed and index always give the same numbers
+    if player.field_maybe_none('equation_seed') is None:
+        player.equation_seed = random.randrange(2 ** 31)
+    rng = random.Random(f'{player.equation_seed}:{index}')
+    return [rng.randint(-99, 99) for _ in range(4)]
 
 
-def record_equation_attempt(player: Player, timestamp):
-    EquationAttempt.create(player=player,
-                           n1=player.n1,
+def generate_client_response(player: Player, start):
+    return dict(
+            start=start,
+            equations=[generate_equation(player, index) for index in range(start, start + C.EQUATION_BATCH)],
+            verified=player.count_equations)
+
+
+def verify_attempts(player: Player, attempts):
+    # Answers are checked in order against the re-generated equations, answers sent before are skipped.
+    # Every verified answer is added to the attempt buffer of the player
+    buffer = json.loads(player.attempt_buffer)
+    for attempt in sorted(attempts, key=lambda attempt: attempt['index']):
+        if attempt['index'] != player.count_equations:
+            continue
+        player.n1, player.n2, player.n3, player.n4 = generate_equation(player, attempt['index'])
+        player.ans_correct = player.n1 + player.n2 + player.n3 + player.n4
+        player.ans_player = int(attempt['value'])
+
+        player.count_equations += 1
+        player.is_correct = player.ans_player == player.ans_correct
+        if player.is_correct:
+            player.count_correct += 1
+
+        buffer.append(dict(n1=player.n1,
                            n2=player.n2,
                            n3=player.n3,
                            n4=player.n4,
                            ans_correct=player.ans_correct,
                            ans_player=player.ans_player,
                            is_correct=player.is_correct,
-                           timestamp=timestamp)
+                           timestamp=str(attempt['timestamp'])))
+    player.attempt_buffer = json.dumps(buffer)
+    return len(buffer)
+
+
+def flush_equation_attempts(player: Player):
+    # All rows are inserted together when the request commits
+    for attempt in json.loads(player.attempt_buffer):
+        EquationAttempt.create(player=player, **attempt)
+    player.attempt_buffer = '[]'
 
 
 def record_math_round_results(player: Player):
@@ -235,45 +275,46 @@ class Introduction(Page):
 @server.map_frisbee_data
 class Task(Page):
     timeout_seconds = C.TIME_PER_ROUND
+    form_model = 'player'
+    form_fields = ['pending_attempts']
 
     @staticmethod
     def is_displayed(player: Player):
-        if not player.recording and not player.results:
-            label = player.participant.label
-            server.start_recording(player, label)
-            player.recording = True
+        if not player.results:
+            start_recording(player)
 
         return True
 
+    @staticmethod
+    def js_vars(player: Player):
+        return dict(
+            refill=C.EQUATION_REFILL,
+            submit_interval=C.SUBMIT_INTERVAL * 1000)
+
     @staticmethod
     def live_method(player, data):
         t = data['type']
 
         if t == 'get':
-            if player.field_maybe_none('n1') is None:
-                generate_equation(player)
-            return {player.id_in_group: generate_client_response(player)}
+            # Without a start the page was (re)loaded and continues after the last verified answer
+            start = data.get('start', player.count_equations)
+            return {player.id_in_group: generate_client_response(player, start)}
 
         elif t == 'submit':
-            player.ans_player = data['value']
-            timestamp = data['timestamp']
-
-            player.count_equations += 1
-            player.is_correct = player.ans_player == player.ans_correct
-            if player.is_correct:
-                player.count_correct += 1
-
-            record_equation_attempt(player, timestamp)
-            generate_equation(player)
-            return {player.id_in_group: generate_client_response(player)}
+            if verify_attempts(player, data['attempts']) >= C.ATTEMPT_FLUSH_SIZE:
+                flush_equation_attempts(player)
+            return {player.id_in_group: dict(verified=player.count_equations)}
 
     @staticmethod
     def before_next_page(player: Player, timeout_happened):
+        pending_attempts = player.field_maybe_none('pending_attempts')
+        if pending_attempts:
+            # Answers given after the last live submit are verified here
+            verify_attempts(player, json.loads(pending_attempts))
+        # Also runs on a timeout without a submit from the page, so no verified attempt is lost
+        flush_equation_attempts(player)
         record_math_round_results(player)
-        if player.recording:
-            label = player.participant.label
-            server.stop_recording(label)
-            player.recording = False
+        stop_recording(player)
         player.results = True
 
 
@@ -0,0 +1,84 @@
+"""
+Starts and stops the heart rate recordings of the Frisbee Server for all apps.
+
+A participant has at most one running recording, kept in the participant field recording as the key of the app and
+round it belongs to and the time it started. Starting the recording that is already running (e.g. after a page
+reload) does nothing, a recording of another app or round that was never stopped is stopped first, and stopping
+without a running recording does nothing. So every app can call start_recording() whenever its recording should run
+and stop_recording() whenever it should not.
+
+Every app with recordings creates its RecordingWindow ExtraModel here, after its Player:
+
+    RecordingWindow = recording_window_model(Player)
+
+When a recording stops, its window is written to the RecordingWindow of the app and round in its key (e.g.
+'math_task:3'), linked to the participant's player of that round, also when another app or round stops it. A window
+whose app has no RecordingWindow is logged and dropped.
+"""
+
+
+import logging
+import time
+
+from otree.api import ExtraModel, models
+from frisbee.otree_extension.server_instance import server
+
+# RecordingWindow of every app, by app name
+window_models = {}
+
+
+def recording_window_model(player_model):
+    # The module of the Player makes the model part of its app, e.g. the table math_task_recordingwindow
+    app_name = player_model.__module__.split('.')[0]
+    window_models[app_name] = type('RecordingWindow', (ExtraModel,), dict(
+        __module__=player_model.__module__,
+        player=models.Link(player_model),
+        key=models.StringField(),
+        start_epoch=models.FloatField(),
+        stop_epoch=models.FloatField(),
+    ))
+    return window_models[app_name]
+
+
+def recording_key(player):
+    # The app of the player class, e.g. 'math_task:3'
+    return f'{type(player).__module__.split(".")[0]}:{player.round_number}'
+
+
+def start_recording(player):
+    participant = player.participant
+    key = recording_key(player)
+    running = participant.field_maybe_none('recording')
+    if running and running['key'] == key:
+        return False
+    if running:
+        stop_recording(player)
+
+    server.start_recording(player, participant.label)
+    participant.recording = dict(key=key, start_epoch=time.time())
+    return True
+
+
+def stop_recording(player):
+    participant = player.participant
+    running = participant.field_maybe_none('recording')
+    if not running:
+        return False
+
+    server.stop_recording(participant.label)
+    participant.recording = None
+    write_recording_window(player, running, time.time())
+    return True
+
+
+def write_recording_window(player, running, stop_epoch):
+    owner = player
+    if running['key'] != recording_key(player):
+        # A recording left running by another app or round belongs to the participant's player of that round
+        owner = next((p for p in player.participant.get_players() if recording_key(p) == running['key']), None)
+    window_model = window_models.get(running['key'].split(':')[0])
+    if owner is None or window_model is None:
+        logging.warning(f"Dropped recording window {running['key']} of participant {player.participant.code}, "
+                        f"its app has no RecordingWindow")
+        return
+    window_model.create(player=owner, key=running['key'], start_epoch=running['start_epoch'], stop_epoch=stop_epoch)
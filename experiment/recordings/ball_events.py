@@ -0,0 +1,76 @@
+"""
+Builds the ball_events table from the BallEvent rows of the ball task.
+
+The ball task logs every spawn, catch and miss with the lane, the speed of the ball and the time in the browser. Here
+the events get the session_code, label and round_number of their participant and a time_recorded_epoch, and are
+indexed like frisbee_base, so the heart rate around an event can be selected by (label, session_code, time range),
+e.g. in the final database:
+
+    SELECT bt.heart_rate, bt.time_recorded_epoch - be.time_recorded_epoch AS offset
+    FROM ball_events be
+    JOIN ball_task_table bt ON bt.label = be.label AND bt.session_code = be.session_code
+        AND bt.time_recorded_epoch BETWEEN be.time_recorded_epoch - 5 AND be.time_recorded_epoch + 5
+    WHERE be.kind = 'miss'
+
+The event times come from the participant's browser and the recording times from the Frisbee Server, so both are only
+as close as the two clocks.
+"""
+
+
+import logging
+import sqlite3
+
+EVENTS_TABLE = 'ball_events'
+SOURCE_TABLE = 'ball_task_ballevent'
+PLAYER_TABLE = 'ball_task_player'
+EVENTS_COLUMNS = ['label TEXT', 'session_code TEXT', 'round_number INTEGER', 'seq INTEGER', 'kind TEXT',
+                  'lane INTEGER', 'speed REAL', 'time_recorded_epoch REAL']
+INDEX = (f"CREATE INDEX IF NOT EXISTS idx_{EVENTS_TABLE}_label_session_time "
+         f"ON {EVENTS_TABLE}(label, session_code, time_recorded_epoch)")
+
+
+def build_ball_events(conn):
+    """
+    Creates ball_events from the BallEvent rows of a merged database.
+
+    Databases of sessions from before the event log get an empty table, so they can be merged like the others.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the merged database
+
+    Returns:
+        int: Number of events
+    """
+    source_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;", (SOURCE_TABLE,)
+    ).fetchone()
+
+    with conn:
+        conn.execute(f"DROP TABLE IF EXISTS {EVENTS_TABLE}")
+        conn.execute(f"CREATE TABLE {EVENTS_TABLE} ({', '.join(EVENTS_COLUMNS)})")
+        if not source_exists:
+            logging.info(f"No {SOURCE_TABLE} table, {EVENTS_TABLE} stays empty")
+            return 0
+
+        cursor = conn.execute(f"""
+            INSERT INTO {EVENTS_TABLE}
+            SELECT otp.label, otp._session_code, p.round_number, be.seq, be.kind, be.lane, be.speed, be.timestamp
+            FROM {SOURCE_TABLE} be
+            JOIN {PLAYER_TABLE} p on be.player_id = p.id
+            JOIN otree_participant otp on p.participant_id = otp.id
+            ORDER BY otp.label, otp._session_code, be.timestamp
+        """)
+        conn.execute(INDEX)
+    return cursor.rowcount
+
+
+def index_ball_events(db_path):
+    """Creates the index of ball_events in the final database, merged tables do not bring their indexes along."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(INDEX)
+    except sqlite3.Error as e:
+        logging.error(f"Error indexing {EVENTS_TABLE} in {db_path}: {str(e)}")
+    finally:
+        conn.close()
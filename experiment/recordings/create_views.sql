@@ -1,17 +1,18 @@
 -- Create the cleaned up view of all of the recordings
+-- (reads the typed frisbee_base table that recordings/main.py materializes from frisbee_sensor_data)
 DROP VIEW IF EXISTS frisbee_view;
 CREATE VIEW frisbee_view AS
 SELECT
-	sd.participant_label as label,
-  JSON_EXTRACT(data, '$.heart_rate') as heart_rate,
-  JSON_EXTRACT(data, '$.rr_intervals') as rr_intervalls,
+	label,
+  heart_rate,
+  rr_intervalls,
   time_recorded,
-  "session.code" as session_code,
+  time_recorded_epoch,
+  session_code,
   current_app_name,
   current_page_name
 
-FROM frisbee_sensor_data sd
-JOIN frisbee_otree_context_data cd on sd.otree_context_data_id = cd.id;
+FROM frisbee_base;
 
 
 
@@ -25,15 +26,14 @@ SELECT
     otp._session_code as session_code,
     mtr.round_number,
 
-    datetime(
-			COALESCE(
-        LAG(mtr.timestamp) OVER (
+    COALESCE(
+        LAG(CAST(mtr.timestamp AS REAL)) OVER (
             PARTITION BY mtp.participant_id
             ORDER BY mtr.round_number
         ),
         0
-    ), 'unixepoch') as round_started_timestamp,
-    datetime(mtr.timestamp, 'unixepoch') as round_finished_timestamp
+    ) as round_started_timestamp,
+    CAST(mtr.timestamp AS REAL) as round_finished_timestamp
 FROM math_task_mathroundresults mtr
     JOIN math_task_player mtp on mtr.player_id = mtp.id
     JOIN otree_participant otp on mtp.participant_id = otp.id;
@@ -54,7 +54,7 @@ FROM frisbee_view fv
 JOIN math_task_rounds mtr ON
 	fv.label = mtr.label AND
   fv.session_code = mtr.session_code AND
-  (fv.time_recorded >= mtr.round_started_timestamp AND fv.time_recorded <= mtr.round_finished_timestamp)
+  (fv.time_recorded_epoch >= mtr.round_started_timestamp AND fv.time_recorded_epoch <= mtr.round_finished_timestamp)
 WHERE current_app_name = 'math_task';
 
 
@@ -66,15 +66,14 @@ SELECT
     btp.participant_id,
     otp._session_code as session_code,
     btr.round_number,
-    datetime(
-			COALESCE(
-        LAG(btr.timestamp) OVER (
+    COALESCE(
+        LAG(CAST(btr.timestamp AS REAL)) OVER (
             PARTITION BY btp.participant_id
             ORDER BY btr.round_number
         ),
         0
-    ), 'unixepoch') as round_started_timestamp,
-    datetime(btr.timestamp, 'unixepoch') as round_finished_timestamp
+    ) as round_started_timestamp,
+    CAST(btr.timestamp AS REAL) as round_finished_timestamp
 FROM
 	ball_task_ballgameresults btr
 JOIN ball_task_player btp on btr.player_id = btp.id
@@ -95,7 +94,7 @@ FROM frisbee_view fv
 JOIN ball_task_rounds btr ON
 	fv.label = btr.label AND
   fv.session_code = btr.session_code AND
-  (fv.time_recorded >= btr.round_started_timestamp AND fv.time_recorded <= btr.round_finished_timestamp)
+  (fv.time_recorded_epoch >= btr.round_started_timestamp AND fv.time_recorded_epoch <= btr.round_finished_timestamp)
 WHERE current_app_name = 'ball_task';
 
 
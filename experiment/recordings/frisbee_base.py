@@ -0,0 +1,147 @@
+"""
+Materializes the frisbee_base table from the raw sensor data of the Frisbee Server.
+
+frisbee_sensor_data stores every measurement as a JSON document. The document is parsed once here into typed columns,
+so the task tables and views built on top of frisbee_base never have to call JSON_EXTRACT again:
+
+    frisbee_base          one row per measurement, id is the id of the frisbee_sensor_data row
+    frisbee_rr_intervals  one row per rr interval of a measurement, in the order they were sent
+"""
+
+
+import json
+import logging
+from datetime import datetime, timezone
+
+FETCH_ROWS = 10_000
+
+SCHEMA = """
+DROP TABLE IF EXISTS frisbee_rr_intervals;
+DROP TABLE IF EXISTS frisbee_base;
+
+CREATE TABLE frisbee_base (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    heart_rate INTEGER,
+    rr_intervalls TEXT,
+    time_recorded TEXT,
+    time_recorded_epoch REAL,
+    session_code TEXT,
+    current_app_name TEXT,
+    current_page_name TEXT
+);
+
+CREATE TABLE frisbee_rr_intervals (
+    sample_id INTEGER NOT NULL REFERENCES frisbee_base(id),
+    position INTEGER NOT NULL,
+    rr_interval INTEGER,
+    PRIMARY KEY (sample_id, position)
+) WITHOUT ROWID;
+"""
+
+INDEXES = [
+    "CREATE INDEX idx_frisbee_base_label_session_time ON frisbee_base(label, session_code, time_recorded_epoch)",
+    "CREATE INDEX idx_frisbee_base_app ON frisbee_base(current_app_name)",
+]
+
+
+def parse_time_recorded(value):
+    """
+    Converts a recorded time to a POSIX timestamp.
+
+    Accepts ISO 8601 strings (naive times are UTC) and numbers. Returns None for values that cannot be parsed.
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        timestamp = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def parse_sensor_data(data):
+    """
+    Extracts heart rate and rr intervals from the JSON document of a measurement.
+
+    Returns:
+        tuple: (heart_rate, rr_intervals), rr_intervals is None if the measurement has none
+    """
+    try:
+        document = json.loads(data) if data is not None else {}
+    except (TypeError, ValueError):
+        return None, None
+    if not isinstance(document, dict):
+        return None, None
+
+    heart_rate = document.get('heart_rate')
+    rr_intervals = document.get('rr_intervals')
+    if not isinstance(rr_intervals, list):
+        rr_intervals = None
+    return heart_rate, rr_intervals
+
+
+def materialize_frisbee_base(conn):
+    """
+    Builds frisbee_base and frisbee_rr_intervals from frisbee_sensor_data and frisbee_otree_context_data.
+
+    Rows are streamed in chunks and written in one transaction.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the merged database
+
+    Returns:
+        int: Number of measurements in frisbee_base
+    """
+    conn.executescript(SCHEMA)
+
+    read_cursor = conn.execute("""
+        SELECT
+            sd.id,
+            sd.participant_label,
+            sd.data,
+            sd.time_recorded,
+            cd."session.code",
+            cd.current_app_name,
+            cd.current_page_name
+        FROM frisbee_sensor_data sd
+        JOIN frisbee_otree_context_data cd on sd.otree_context_data_id = cd.id
+    """)
+
+    samples = 0
+    unparsed_times = 0
+    with conn:
+        for chunk in iter(lambda: read_cursor.fetchmany(FETCH_ROWS), []):
+            base_rows = []
+            rr_rows = []
+            for sample_id, label, data, time_recorded, session_code, app_name, page_name in chunk:
+                heart_rate, rr_intervals = parse_sensor_data(data)
+                time_recorded_epoch = parse_time_recorded(time_recorded)
+                if time_recorded_epoch is None:
+                    unparsed_times += 1
+
+                rr_text = None
+                if rr_intervals is not None:
+                    # Same text JSON_EXTRACT returned for the list
+                    rr_text = json.dumps(rr_intervals, separators=(',', ':'))
+                    rr_rows.extend((sample_id, position, rr) for position, rr in enumerate(rr_intervals))
+
+                base_rows.append((sample_id, label, heart_rate, rr_text, time_recorded, time_recorded_epoch,
+                                  session_code, app_name, page_name))
+
+            conn.executemany("INSERT INTO frisbee_base VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", base_rows)
+            conn.executemany("INSERT INTO frisbee_rr_intervals VALUES (?, ?, ?)", rr_rows)
+            samples += len(base_rows)
+
+        for statement in INDEXES:
+            conn.execute(statement)
+
+    if unparsed_times:
+        logging.warning(f"{unparsed_times} measurements have a time_recorded that could not be parsed")
+    return samples
@@ -0,0 +1,265 @@
+"""
+Heart rate variability features per participant, task and round, written to the hrv_features table.
+
+The features follow the definitions of the analysis notebook (data_analysis/analysis.Rmd), computed with NumPy on the
+rr intervals of a window in seconds:
+
+    time domain   mean_rr, sdnn, rmssd, nn50, pnn50 (> 50 ms), tri_index (Freedman-Diaconis histogram), cv
+    frequency     ULF/VLF/LF/HF band power of the instantaneous heart rate interpolated at 4 Hz, averaged over
+                  8 s windows shifted by 4 s (like RHRV's CalculatePowerBand), lf_hf_ratio, peaks and spread
+    nonlinear     sd1, sd2 (Poincare plot), sample_entropy (m = 2, r = 0.2 * sd)
+    rise / fall   size of runs of increasing / decreasing intervals and how often intervals increase / decrease
+
+A window is every recording of one participant (session_label) in one round of a task; tasks without rounds form
+one window per participant.
+"""
+
+
+import itertools
+import json
+import logging
+import math
+import sqlite3
+
+import numpy as np
+
+INTERPOLATION_HZ = 4
+SPECTRUM_WINDOW_SECONDS = 8
+SPECTRUM_SHIFT_SECONDS = 4
+BANDS = {
+    'ulf': (0.0, 0.03),
+    'vlf': (0.03, 0.05),
+    'lf': (0.05, 0.15),
+    'hf': (0.15, 0.4),
+}
+NN50_SECONDS = 0.05
+
+FEATURES = [
+    'n_beats', 'mean_hr', 'sd_hr',
+    'mean_rr', 'sdnn', 'rmssd', 'nn50', 'pnn50', 'tri_index', 'cv',
+    'lf_power', 'hf_power', 'vlf_power', 'ulf_power', 'lf_hf_ratio', 'total_power', 'peak_lf', 'peak_hf', 'sd_lf',
+    'sd_hf',
+    'sd1', 'sd2', 'sd1_sd2_ratio', 'sample_entropy',
+    'max_rise_time', 'max_fall_time', 'mean_rise_time', 'mean_fall_time', 'rise_rate', 'fall_rate',
+]
+KEY_COLUMNS = ['session_label', 'session_code', 'label', 'task', 'round_number']
+
+
+def time_features(rr):
+    diffs = np.diff(rr)
+    mean_rr = rr.mean()
+    sdnn = rr.std(ddof=1)
+    nn50 = int(np.count_nonzero(np.abs(diffs) > NN50_SECONDS))
+    counts, _ = np.histogram(rr, bins='fd')
+    return {
+        'mean_rr': mean_rr,
+        'sdnn': sdnn,
+        'rmssd': np.sqrt(np.mean(diffs ** 2)),
+        'nn50': nn50,
+        'pnn50': nn50 / len(diffs) * 100,
+        'tri_index': len(rr) / counts.max(),
+        'cv': sdnn / mean_rr * 100,
+    }
+
+
+def band_powers(rr):
+    """Power of every band in each 8 s window of the instantaneous heart rate, shape (bands, windows)."""
+    beat_times = np.cumsum(rr)
+    grid = np.arange(beat_times[0], beat_times[-1], 1 / INTERPOLATION_HZ)
+    heart_rate = np.interp(grid, beat_times, 60 / rr)
+
+    size = SPECTRUM_WINDOW_SECONDS * INTERPOLATION_HZ
+    if len(heart_rate) < size:
+        return None
+    windows = np.lib.stride_tricks.sliding_window_view(heart_rate, size)[::SPECTRUM_SHIFT_SECONDS * INTERPOLATION_HZ]
+    windows = windows - windows.mean(axis=1, keepdims=True)
+
+    taper = np.hamming(size)
+    spectrum = np.abs(np.fft.rfft(windows * taper, axis=1)) ** 2 / (INTERPOLATION_HZ * np.sum(taper ** 2))
+    spectrum[:, 1:] *= 2  # one-sided
+    frequencies = np.fft.rfftfreq(size, 1 / INTERPOLATION_HZ)
+    df = frequencies[1]
+    return {
+        band: spectrum[:, (frequencies >= low) & (frequencies < high)].sum(axis=1) * df
+        for band, (low, high) in BANDS.items()
+    }
+
+
+def frequency_features(rr):
+    powers = band_powers(rr)
+    if powers is None:
+        return {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lf_hf = powers['lf'] / powers['hf']
+    mean_powers = {band: powers[band].mean() for band in BANDS}
+    return {
+        'lf_power': mean_powers['lf'],
+        'hf_power': mean_powers['hf'],
+        'vlf_power': mean_powers['vlf'],
+        'ulf_power': mean_powers['ulf'],
+        'lf_hf_ratio': np.nanmean(lf_hf) if np.isfinite(lf_hf).any() else None,
+        'total_power': sum(mean_powers.values()),
+        'peak_lf': powers['lf'].max(),
+        'peak_hf': powers['hf'].max(),
+        'sd_lf': powers['lf'].std(ddof=1) if len(powers['lf']) > 1 else None,
+        'sd_hf': powers['hf'].std(ddof=1) if len(powers['hf']) > 1 else None,
+    }
+
+
+def sample_entropy(rr, m=2):
+    """Sample entropy with the notebook's counting: every template against every window, minus the self-match."""
+    r = 0.2 * rr.std(ddof=1)
+    templates = len(rr) - m
+    if r == 0 or templates < 1:
+        return None
+
+    def matches(length):
+        windows = np.lib.stride_tricks.sliding_window_view(rr, length)
+        distances = np.abs(windows[:templates, None, :] - windows[None, :, :]).max(axis=2)
+        return np.count_nonzero(distances < r) - templates
+
+    a = matches(m + 1)
+    b = matches(m)
+    if b == 0 or a == 0:
+        return None
+    return -math.log(a / b)
+
+
+def nonlinear_features(rr):
+    sd1 = np.std(np.diff(rr) / np.sqrt(2), ddof=1)
+    sd2 = np.sqrt(2 * rr.var(ddof=1) - sd1 ** 2)
+    return {
+        'sd1': sd1,
+        'sd2': sd2,
+        'sd1_sd2_ratio': sd1 / sd2 if sd2 else None,
+        'sample_entropy': sample_entropy(rr),
+    }
+
+
+def run_sums(values, mask):
+    """Sums of the runs where mask holds that end before the last value (a run still open at the end is not counted)."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    closed = ends < len(values)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    return cumulative[ends[closed]] - cumulative[starts[closed]]
+
+
+def rise_fall_features(rr):
+    diffs = np.diff(rr)
+    # Like the notebook, the last difference never extends a run
+    considered = diffs[:-1]
+    rise_times = run_sums(considered, considered > 0)
+    fall_times = run_sums(-considered, considered < 0)
+    return {
+        'max_rise_time': rise_times.max() if len(rise_times) else None,
+        'max_fall_time': fall_times.max() if len(fall_times) else None,
+        'mean_rise_time': rise_times.mean() if len(rise_times) else None,
+        'mean_fall_time': fall_times.mean() if len(fall_times) else None,
+        'rise_rate': np.count_nonzero(diffs > 0) / len(diffs),
+        'fall_rate': np.count_nonzero(diffs < 0) / len(diffs),
+    }
+
+
+def window_features(heart_rates, rr_intervals_ms):
+    """
+    Computes all features of one window.
+
+    Args:
+        heart_rates (list): Heart rate of every recording in bpm
+        rr_intervals_ms (list): rr intervals of all recordings in ms, in recording order
+
+    Returns:
+        dict: Value of every feature, None where the window is too short for it
+    """
+    heart_rate = np.array([hr for hr in heart_rates if hr is not None], dtype=float)
+    rr = np.array(rr_intervals_ms, dtype=float) / 1000
+    rr = rr[rr > 0]
+
+    features = dict.fromkeys(FEATURES)
+    features['n_beats'] = len(rr)
+    if len(heart_rate):
+        features['mean_hr'] = heart_rate.mean()
+        features['sd_hr'] = heart_rate.std(ddof=1) if len(heart_rate) > 1 else None
+    if len(rr) >= 3:
+        features.update(time_features(rr))
+        features.update(frequency_features(rr))
+        features.update(nonlinear_features(rr))
+        features.update(rise_fall_features(rr))
+
+    return {
+        name: None if value is None or (isinstance(value, float) and not math.isfinite(value)) else float(value)
+        for name, value in features.items()
+    }
+
+
+def parse_rr_intervalls(value):
+    if not value:
+        return []
+    rr_intervals = json.loads(value)
+    return rr_intervals if isinstance(rr_intervals, list) else []
+
+
+def compute_hrv_features(db_path, tables, session_codes=None):
+    """
+    Computes the features of every window of the task tables and writes them to hrv_features.
+
+    Args:
+        db_path (str): Path to the final merged database
+        tables (list): Names of the task tables
+        session_codes (list): Only recompute the windows of these sessions (default: all)
+
+    Returns:
+        int: Number of windows
+    """
+    conn = sqlite3.connect(db_path)
+    columns = ", ".join([f"{column} TEXT" for column in KEY_COLUMNS[:-1]] + ['round_number INTEGER'] +
+                        [f"{feature} REAL" for feature in FEATURES])
+    conn.execute(f"CREATE TABLE IF NOT EXISTS hrv_features ({columns})")
+
+    session_filter = ""
+    parameters = []
+    if session_codes is not None:
+        session_filter = f"WHERE session_code IN ({', '.join('?' for _ in session_codes)})"
+        parameters = list(session_codes)
+
+    windows = 0
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM hrv_features {session_filter}", parameters)
+
+            for table in tables:
+                table_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if not table_columns:
+                    continue
+                round_column = 'round_number' if 'round_number' in table_columns else 'NULL'
+                rows = conn.execute(f"""
+                    SELECT session_code, label, current_app_name, {round_column}, heart_rate, rr_intervalls
+                    FROM {table}
+                    {session_filter}
+                    ORDER BY session_code, label, {round_column}, time_recorded_epoch, time_recorded
+                """, parameters)
+
+                feature_rows = []
+                for (session_code, label, task, round_number), window in itertools.groupby(
+                        rows, key=lambda row: row[:4]):
+                    window = list(window)
+                    rr_intervals = [rr for row in window for rr in parse_rr_intervalls(row[5])]
+                    features = window_features([row[4] for row in window], rr_intervals)
+                    feature_rows.append([f"{session_code}_{label}", session_code, label, task, round_number] +
+                                        [features[feature] for feature in FEATURES])
+
+                conn.executemany(
+                    f"INSERT INTO hrv_features VALUES ({', '.join('?' for _ in KEY_COLUMNS + FEATURES)})",
+                    feature_rows
+                )
+                windows += len(feature_rows)
+
+    except sqlite3.Error as e:
+        logging.error(f"Error computing HRV features in {db_path}: {str(e)}")
+
+    finally:
+        conn.close()
+
+    return windows
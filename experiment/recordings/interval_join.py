@@ -0,0 +1,153 @@
+"""
+Builds the task tables from the recordings in frisbee_base and assigns recordings to the rounds of a task.
+
+A round ends at the timestamp of its results row and starts where the participant's previous round ended, so a
+recording belongs to the round whose interval (previous end, end] contains it. Recordings and round ends are both
+sorted by participant and time, which turns the assignment into a single sort-merge pass instead of SQLite's nested
+loop over a range join. All task tables are filled from one scan of frisbee_base.
+"""
+
+
+import itertools
+import logging
+
+FETCH_ROWS = 10_000
+
+TABLE_COLUMNS = ['label TEXT', 'session_code TEXT', 'current_app_name TEXT', 'heart_rate INTEGER',
+                 'rr_intervalls TEXT', 'time_recorded TEXT', 'time_recorded_epoch REAL']
+ROUND_TABLE_COLUMNS = TABLE_COLUMNS[:3] + ['round_number INTEGER'] + TABLE_COLUMNS[3:]
+
+
+def assign_rounds(times, round_ends, max_round_duration=None):
+    """
+    Labels sorted recording times with the round they fall into.
+
+    Args:
+        times (list): POSIX timestamps of one participant's recordings, ascending
+        round_ends (list): (round_end, round_number) of the same participant, ascending
+        max_round_duration (float): Leave out recordings more than this many seconds before the end of their round
+
+    Returns:
+        list: Round number of every recording, None for recordings outside of all rounds
+    """
+    rounds = []
+    index = 0
+    for time_recorded in times:
+        while index < len(round_ends) and time_recorded > round_ends[index][0]:
+            index += 1
+        if index == len(round_ends):
+            # Later recordings are after the last round as well
+            rounds.extend([None] * (len(times) - len(rounds)))
+            break
+
+        round_end, round_number = round_ends[index]
+        if max_round_duration is not None and time_recorded < round_end - max_round_duration:
+            rounds.append(None)
+        else:
+            rounds.append(round_number)
+    return rounds
+
+
+def read_round_ends(conn, results_table, player_table):
+    """
+    Reads when each participant finished each round.
+
+    Returns:
+        dict: Sorted (round_end, round_number) per (label, session_code)
+    """
+    rows = conn.execute(f"""
+        SELECT otp.label, otp._session_code, CAST(rr.timestamp AS REAL), rr.round_number
+        FROM {results_table} rr
+        JOIN {player_table} p on rr.player_id = p.id
+        JOIN otree_participant otp on p.participant_id = otp.id
+        WHERE rr.timestamp IS NOT NULL
+        ORDER BY otp.label, otp._session_code, CAST(rr.timestamp AS REAL)
+    """)
+    return {
+        participant: [(round_end, round_number) for _, _, round_end, round_number in participant_rows]
+        for participant, participant_rows in itertools.groupby(rows, key=lambda row: (row[0], row[1]))
+    }
+
+
+def build_task_tables(conn, tasks, max_round_duration=None):
+    """
+    Creates the task table of every task in one scan of frisbee_base.
+
+    Tables of tasks with rounds get the round number of every recording, recordings outside of all rounds are
+    left out.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the merged database with frisbee_base
+        tasks (list): Tasks of the task registry
+        max_round_duration (float): Leave out recordings more than this many seconds before the end of their round
+
+    Returns:
+        dict: Number of rows of every task table
+    """
+    tasks_by_app = {task.app_name: task for task in tasks}
+    round_ends = {
+        task.app_name: read_round_ends(conn, task.results_table, task.player_table)
+        for task in tasks if task.has_rounds
+    }
+
+    for task in tasks:
+        columns = ROUND_TABLE_COLUMNS if task.has_rounds else TABLE_COLUMNS
+        conn.execute(f"DROP TABLE IF EXISTS {task.table}")
+        conn.execute(f"CREATE TABLE {task.table} ({', '.join(columns)})")
+
+    placeholders = ", ".join('?' for _ in tasks_by_app)
+    samples = conn.execute(f"""
+        SELECT label, session_code, current_app_name, heart_rate, rr_intervalls, time_recorded, time_recorded_epoch
+        FROM frisbee_base
+        WHERE current_app_name IN ({placeholders})
+        ORDER BY label, session_code, time_recorded_epoch
+    """, list(tasks_by_app))
+
+    rows = {task.table: [] for task in tasks}
+    written = dict.fromkeys(rows, 0)
+    unassigned = dict.fromkeys(round_ends, 0)
+
+    def flush(table):
+        task_rows = rows[table]
+        if task_rows:
+            conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in task_rows[0])})", task_rows)
+            written[table] += len(task_rows)
+            rows[table] = []
+
+    with conn:
+        for participant, participant_samples in itertools.groupby(samples, key=lambda row: (row[0], row[1])):
+            samples_by_app = {}
+            for sample in participant_samples:
+                samples_by_app.setdefault(sample[2], []).append(sample)
+
+            for app_name, app_samples in samples_by_app.items():
+                task = tasks_by_app[app_name]
+                if not task.has_rounds:
+                    rows[task.table].extend(app_samples)
+                else:
+                    # Recordings without a time cannot be placed in a round
+                    timed_samples = [sample for sample in app_samples if sample[6] is not None]
+                    rounds = assign_rounds(
+                        [sample[6] for sample in timed_samples],
+                        round_ends[app_name].get(participant, []),
+                        max_round_duration,
+                    )
+                    unassigned[app_name] += len(app_samples) - len(timed_samples)
+                    for sample, round_number in zip(timed_samples, rounds):
+                        if round_number is None:
+                            unassigned[app_name] += 1
+                        else:
+                            rows[task.table].append(sample[:3] + (round_number,) + sample[3:])
+
+                if len(rows[task.table]) >= FETCH_ROWS:
+                    flush(task.table)
+
+        for task in tasks:
+            flush(task.table)
+            conn.execute(f"CREATE INDEX idx_{task.table}_label_session ON {task.table}(label, session_code)")
+
+    for app_name, count in unassigned.items():
+        if count:
+            logging.info(f"{count} {app_name} recordings are outside of all rounds "
+                         f"and not in {tasks_by_app[app_name].table}")
+    return written
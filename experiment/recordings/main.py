@@ -1,10 +1,23 @@
 import sqlite3
-import pandas as pd
 import os
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import logging
 import re
 
+from ball_events import EVENTS_TABLE, build_ball_events, index_ball_events
+from frisbee_base import materialize_frisbee_base
+from hrv_features import compute_hrv_features
+from interval_join import build_task_tables
+from parquet_export import export_parquet, import_pyarrow
+from quality_check import QUALITY_TABLE, check_quality
+from resampled_series import RESAMPLE_RATE, ROUND_SECONDS, write_resampled_series
+from session_store import write_session_store
+from task_registry import discover_tasks
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -16,45 +29,90 @@ logging.basicConfig(
 )
 
 
+DATABASE_FILE_PATTERN = re.compile(r'[-_](\d+)\.(db|sqlite3)$')
+
+
 def get_paired_databases(data_dir):
     """
     Finds and pairs database files based on their numeric suffix.
 
+    The files are indexed by suffix in one pass. Files that do not follow the naming scheme, suffixes with only
+    one or with several files of a kind, and pairs whose oTree and HR databases share no session are reported
+    and left out, before anything is copied.
+
     Args:
         data_dir (str): Path to the directory containing database files
 
     Returns:
-        list: List of tuples containing paired database paths (otree_db, hr_db)
+        list: List of tuples containing paired database paths (otree_db, hr_db), ordered by suffix
     """
     data_path = Path(data_dir)
 
-    # Get all database files
-    db_files = list(data_path.glob("*.db"))
-    sqlite3_files = list(data_path.glob("*.sqlite3"))
+    # Index all database files by the number in their name (e.g., "file-1.db" -> 1)
+    files_by_number = {}
+    for path in sorted(data_path.iterdir()):
+        if path.suffix not in ('.db', '.sqlite3'):
+            continue
+        match = DATABASE_FILE_PATTERN.search(path.name)
+        if not match:
+            logging.warning(f"Skipping {path.name}: no numeric suffix like file-1{path.suffix}")
+            continue
+        files = files_by_number.setdefault(int(match.group(1)), {'db': [], 'sqlite3': []})
+        files[match.group(2)].append(path)
 
-    # Extract numbers from filenames and create pairs
     pairs = []
-    for db_file in db_files:
-        # Extract number from filename (e.g., "file-1.db" -> "1")
-        db_num = re.search(r'-(\d+)\.db$', db_file.name)
-        if db_num:
-            num = db_num.group(1)
-            # Find matching sqlite3 file
-            matching_sqlite3 = next(
-                (f for f in sqlite3_files if f.name.endswith(f'-{num}.sqlite3')),
-                None
-            )
-            if matching_sqlite3:
-                pairs.append((db_file, matching_sqlite3))
-                logging.info(f"Paired databases: {db_file.name} <-> {matching_sqlite3.name}")
+    for num, files in sorted(files_by_number.items()):
+        if len(files['db']) > 1 or len(files['sqlite3']) > 1:
+            names = ", ".join(f.name for f in files['db'] + files['sqlite3'])
+            logging.error(f"Skipping suffix {num}: duplicate databases {names}")
+            continue
+        if not files['db'] or not files['sqlite3']:
+            orphan = (files['db'] + files['sqlite3'])[0]
+            logging.warning(f"Skipping {orphan.name}: no matching {'.sqlite3' if files['db'] else '.db'} file")
+            continue
+
+        otree_db, hr_db = files['db'][0], files['sqlite3'][0]
+        if not check_pair_sessions(otree_db, hr_db):
+            continue
+        pairs.append((otree_db, hr_db))
+        logging.info(f"Paired databases: {otree_db.name} <-> {hr_db.name}")
 
     return pairs
 
 
+def check_pair_sessions(otree_db, hr_db):
+    """
+    Compares the sessions of the participants in the oTree database with the sessions recorded in the HR database.
+
+    Returns:
+        bool: False if the databases have no session in common
+    """
+    otree_sessions = set(read_session_codes(otree_db))
+    hr_sessions = set(read_hr_session_codes(hr_db))
+
+    if not otree_sessions & hr_sessions:
+        logging.error(f"Skipping {otree_db.name} <-> {hr_db.name}: no common session "
+                      f"(oTree: {sorted(otree_sessions)}, HR: {sorted(hr_sessions)})")
+        return False
+    if otree_sessions != hr_sessions:
+        logging.warning(f"Sessions of {otree_db.name} <-> {hr_db.name} differ: "
+                        f"only in oTree {sorted(otree_sessions - hr_sessions)}, "
+                        f"only in HR {sorted(hr_sessions - otree_sessions)}")
+    return True
+
+
+def quote_identifier(name):
+    """Quotes a table or column name for use in SQL (column names like "session.code" need it)."""
+    return '"' + name.replace('"', '""') + '"'
+
+
 def merge_pair_to_temp(otree_db, hr_db, temp_db):
     """
     Merges a pair of databases into a temporary database.
 
+    The source databases are attached to the temporary database and every table is copied with
+    INSERT INTO ... SELECT, so rows are streamed by SQLite and never loaded into memory.
+
     Args:
         otree_db (Path): Path to otree database
         hr_db (Path): Path to HR database
@@ -64,135 +122,488 @@ def merge_pair_to_temp(otree_db, hr_db, temp_db):
     if os.path.exists(temp_db):
         os.remove(temp_db)
 
+    dest_conn = sqlite3.connect(temp_db)
+
     # Copy all tables from both databases
     for src_db, src_type in [(otree_db, 'oTree'), (hr_db, 'HR')]:
         try:
-            src_conn = sqlite3.connect(src_db)
-            dest_conn = sqlite3.connect(temp_db)
+            dest_conn.execute("ATTACH DATABASE ? AS src", (str(src_db),))
+        except sqlite3.Error as e:
+            logging.error(f"Error processing {src_db}: {str(e)}")
+            continue
 
+        try:
             # Get all tables
-            cursor = src_conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-
-            # Copy each table
-            for table_info in tables:
-                table_name = table_info[0]
-                df = pd.read_sql_query(f"SELECT * FROM {table_name}", src_conn)
-                df.to_sql(table_name, dest_conn, index=False, if_exists='append')
-                logging.info(f"Copied table {table_name} from {src_type} database {src_db.name}")
-
-            src_conn.close()
-            dest_conn.close()
+            tables = dest_conn.execute(
+                "SELECT name, sql FROM src.sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
+            ).fetchall()
+
+            # Copy each table, all tables of one source in one transaction
+            with dest_conn:
+                for table_name, create_sql in tables:
+                    table_exists = dest_conn.execute(
+                        "SELECT 1 FROM main.sqlite_master WHERE type='table' AND name=?;", (table_name,)
+                    ).fetchone()
+                    if not table_exists:
+                        # An unqualified CREATE TABLE creates the table in the main (temporary) database
+                        dest_conn.execute(create_sql)
+
+                    columns = [
+                        row[1] for row in dest_conn.execute(f"PRAGMA src.table_info({quote_identifier(table_name)})")
+                    ]
+                    column_list = ", ".join(quote_identifier(column) for column in columns)
+                    dest_conn.execute(
+                        f"INSERT INTO main.{quote_identifier(table_name)} ({column_list}) "
+                        f"SELECT {column_list} FROM src.{quote_identifier(table_name)}"
+                    )
+                    logging.info(f"Copied table {table_name} from {src_type} database {src_db.name}")
 
         except sqlite3.Error as e:
             logging.error(f"Error processing {src_db}: {str(e)}")
-            continue
+
+        finally:
+            dest_conn.execute("DETACH DATABASE src")
+
+    dest_conn.close()
+
+
+MANIFEST_TABLE = 'merge_manifest'
+
+
+def read_session_codes(otree_db):
+    """
+    Reads the session codes of the participants in an oTree database.
+
+    Args:
+        otree_db (Path): Path to otree database
+
+    Returns:
+        list: Sorted session codes
+    """
+    conn = sqlite3.connect(f"file:{otree_db}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT DISTINCT _session_code FROM otree_participant").fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error reading session codes from {otree_db}: {str(e)}")
+        rows = []
+    finally:
+        conn.close()
+    return sorted(code for code, in rows if code is not None)
 
 
-def execute_sql_script(db_path, script_path):
+def read_hr_session_codes(hr_db):
     """
-    Executes SQL script on a database.
+    Reads the session codes recorded in an HR database.
 
     Args:
-        db_path (str): Path to the database
-        script_path (str): Path to the SQL script
+        hr_db (Path): Path to HR database
+
+    Returns:
+        list: Sorted session codes
     """
+    conn = sqlite3.connect(f"file:{hr_db}?mode=ro", uri=True)
     try:
-        with open(script_path, 'r') as file:
-            sql_script = file.read()
+        rows = conn.execute('SELECT DISTINCT "session.code" FROM frisbee_otree_context_data').fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error reading session codes from {hr_db}: {str(e)}")
+        rows = []
+    finally:
+        conn.close()
+    return sorted(code for code, in rows if code is not None)
+
+
+def file_sha256(path):
+    """Hashes a file in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(final_db):
+    """
+    Reads the manifest of already merged pairs from the final database.
+
+    Returns:
+        dict: Manifest entries keyed by (otree_db, hr_db) file name
+    """
+    if not os.path.exists(final_db):
+        return {}
 
-        conn = sqlite3.connect(db_path)
-        conn.executescript(sql_script)
-        conn.commit()
+    conn = sqlite3.connect(final_db)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f"SELECT * FROM {MANIFEST_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        # Final database of a full merge from before the manifest existed
+        rows = []
+    finally:
         conn.close()
-        logging.info(f"Successfully executed SQL script on {db_path}")
+    return {(row['otree_db'], row['hr_db']): dict(row) for row in rows}
+
+
+def manifest_entry(otree_db, hr_db, previous=None):
+    """
+    Describes the current state of a pair of database files for the manifest.
 
-    except (sqlite3.Error, IOError) as e:
-        logging.error(f"Error executing SQL script: {str(e)}")
+    Files are only hashed when their size or modification time differ from the previous entry.
 
+    Args:
+        otree_db (Path): Path to otree database
+        hr_db (Path): Path to HR database
+        previous (dict): Manifest entry of the pair from the last merge, if any
 
-def merge_final_tables(temp_dbs, final_db):
+    Returns:
+        dict: Manifest entry without the session codes
+    """
+    entry = {'otree_db': otree_db.name, 'hr_db': hr_db.name}
+    for prefix, path in [('otree', otree_db), ('hr', hr_db)]:
+        stat = path.stat()
+        entry[f'{prefix}_size'] = stat.st_size
+        entry[f'{prefix}_mtime'] = stat.st_mtime
+        if (previous and previous[f'{prefix}_size'] == stat.st_size
+                and previous[f'{prefix}_mtime'] == stat.st_mtime):
+            entry[f'{prefix}_sha256'] = previous[f'{prefix}_sha256']
+        else:
+            entry[f'{prefix}_sha256'] = file_sha256(path)
+    return entry
+
+
+def pair_is_unchanged(entry, previous):
+    """Checks whether a pair still has the contents it had when it was merged."""
+    return (previous is not None
+            and entry['otree_sha256'] == previous['otree_sha256']
+            and entry['hr_sha256'] == previous['hr_sha256'])
+
+
+def write_manifest_entry(conn, entry):
+    """Inserts or replaces the manifest entry of a pair (the caller commits)."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            otree_db TEXT NOT NULL,
+            hr_db TEXT NOT NULL,
+            otree_size INTEGER,
+            otree_mtime REAL,
+            otree_sha256 TEXT,
+            hr_size INTEGER,
+            hr_mtime REAL,
+            hr_sha256 TEXT,
+            session_codes TEXT,
+            merged_at REAL,
+            PRIMARY KEY (otree_db, hr_db)
+        )
+    """)
+    columns = list(entry)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {MANIFEST_TABLE} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})",
+        [entry[column] for column in columns]
+    )
+
+
+def merge_final_tables(temp_dbs, final_db, tables_to_merge, manifest_entries=None):
     """
-    Merges specified tables from all temporary databases into final database.
+    Appends specified tables from all temporary databases to the final database.
+
+    Each temporary database is attached once and all of its tables are appended with INSERT INTO ... SELECT
+    in one transaction, so the merge is a single pass over the temporary databases. Ids are assigned
+    incrementally across all temporary databases.
+
+    With manifest entries, rows of the entry's sessions that are already in the final database are replaced,
+    and the entry is written to the manifest in the same transaction. If a table of a pair cannot be appended, the
+    pair is rolled back and gets no manifest entry, so the next run merges it again.
 
     Args:
         temp_dbs (list): List of temporary database paths
         final_db (str): Path for final merged database
+        tables_to_merge (list): Names of the task tables
+        manifest_entries (list): Manifest entry of the pair of each temporary database
     """
-    tables_to_merge = [
-        'math_task_table',
-        'ball_task_table',
-        'video_one_table',
-        'video_two_table'
-    ]
+    final_conn = sqlite3.connect(final_db)
+    total_rows = dict.fromkeys(tables_to_merge, 0)
+    previous_manifest = read_manifest(final_db)
 
-    if os.path.exists(final_db):
-        os.remove(final_db)
+    for index, temp_db in enumerate(temp_dbs):
+        entry = manifest_entries[index] if manifest_entries else None
+        final_conn.execute("ATTACH DATABASE ? AS temp_db", (temp_db,))
+        pair_rows = {}
+        try:
+            with final_conn:
+                if entry:
+                    previous = previous_manifest.get((entry['otree_db'], entry['hr_db']))
+                    replace_sessions(final_conn, tables_to_merge, entry, previous)
+
+                for table in tables_to_merge:
+                    columns = [
+                        (row[1], row[2]) for row in final_conn.execute(f"PRAGMA temp_db.table_info({table})")
+                        if row[1] != 'id'
+                    ]
+                    if not columns:
+                        # Roll back the pair, without the manifest entry it is merged again on the next run
+                        raise sqlite3.OperationalError(f"no such table: {table}")
+
+                    column_definitions = ", ".join(
+                        f"{quote_identifier(name)} {column_type}".rstrip() for name, column_type in columns
+                    )
+                    final_conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS main.{table} (id INTEGER PRIMARY KEY, {column_definitions})"
+                    )
+                    # Columns added to the task tables since the final database was created
+                    final_columns = {row[1] for row in final_conn.execute(f"PRAGMA main.table_info({table})")}
+                    for name, column_type in columns:
+                        if name not in final_columns:
+                            final_conn.execute(
+                                f"ALTER TABLE main.{table} ADD COLUMN {quote_identifier(name)} {column_type}".rstrip()
+                            )
+
+                    # Continue the ids where the previous temporary database stopped
+                    next_id = final_conn.execute(f"SELECT COALESCE(MAX(id) + 1, 0) FROM main.{table}").fetchone()[0]
+                    column_list = ", ".join(quote_identifier(name) for name, _ in columns)
+                    cursor = final_conn.execute(
+                        f"INSERT INTO main.{table} (id, {column_list}) "
+                        f"SELECT ROW_NUMBER() OVER () - 1 + ?, {column_list} FROM temp_db.{table}",
+                        (next_id,)
+                    )
+                    pair_rows[table] = cursor.rowcount
+
+                # Only after every table of the pair was appended
+                if entry:
+                    write_manifest_entry(final_conn, {**entry, 'merged_at': time.time()})
+
+            for table, rows in pair_rows.items():
+                total_rows[table] += rows
 
-    final_conn = sqlite3.connect(final_db)
+        except sqlite3.Error as e:
+            logging.error(f"Error merging {temp_db}: {str(e)}")
 
-    for table in tables_to_merge:
-        combined_data = pd.DataFrame()
+        finally:
+            final_conn.execute("DETACH DATABASE temp_db")
 
-        for temp_db in temp_dbs:
-            try:
-                temp_conn = sqlite3.connect(temp_db)
-                df = pd.read_sql_query(f"SELECT * FROM {table}", temp_conn)
-                combined_data = pd.concat([combined_data, df], ignore_index=True)
-                temp_conn.close()
-            except sqlite3.Error as e:
-                logging.error(f"Error reading {table} from {temp_db}: {str(e)}")
-                continue
-
-        if not combined_data.empty:
-            # Reset index if there's an 'id' column
-            if 'id' in combined_data.columns:
-                combined_data = combined_data.drop('id', axis=1)
-
-            combined_data.to_sql(table, final_conn, index=True, index_label='id')
-            logging.info(f"Merged {table} with {len(combined_data)} total rows")
+    for table, rows in total_rows.items():
+        if rows:
+            logging.info(f"Appended {rows} rows to {table}")
 
     final_conn.close()
 
 
-def process_databases():
+def replace_sessions(conn, tables, entry, previous):
+    """Deletes the rows of a pair's sessions from the final tables before the pair is merged again."""
+    session_codes = set(json.loads(entry['session_codes']))
+    if previous:
+        session_codes.update(json.loads(previous['session_codes']))
+    if not session_codes:
+        return
+
+    placeholders = ", ".join('?' for _ in session_codes)
+    for table in tables:
+        table_exists = conn.execute(
+            "SELECT 1 FROM main.sqlite_master WHERE type='table' AND name=?;", (table,)
+        ).fetchone()
+        if table_exists:
+            cursor = conn.execute(
+                f"DELETE FROM main.{table} WHERE session_code IN ({placeholders})", sorted(session_codes)
+            )
+            if cursor.rowcount:
+                logging.info(f"Removed {cursor.rowcount} rows of {entry['otree_db']} from {table} before re-merging")
+
+
+def process_pair(index, otree_db, hr_db, tasks, max_round_duration=None, parquet_dir=None, clean=False):
+    """
+    Merges one pair of databases into its temporary database and builds the task tables there.
+
+    Runs in a worker process of process_databases.
+
+    Args:
+        tasks (list): Tasks of the task registry
+        max_round_duration (float): Leave out recordings more than this many seconds before the end of their round
+        parquet_dir (str): Also export the task tables of the pair as Parquet to this directory
+        clean (bool): Remove the artifacts found by the quality check before building the task tables
+
+    Returns:
+        str: Path of the temporary database, None if the task tables could not be built
+    """
+    temp_db = f"temp_merged_{index}.sqlite3"
+
+    # Merge pair into temporary database
+    logging.info(f"\nProcessing pair {index + 1}: {otree_db.name} and {hr_db.name}")
+    merge_pair_to_temp(otree_db, hr_db, temp_db)
+
+    conn = sqlite3.connect(temp_db)
+    try:
+        # Parse the sensor data once into the typed frisbee_base table
+        samples = materialize_frisbee_base(conn)
+        logging.info(f"Materialized frisbee_base with {samples} recordings in {temp_db}")
+
+        flagged = check_quality(conn, tasks, clean)
+        logging.info(f"Wrote {QUALITY_TABLE} of {temp_db}, {flagged} participant/app groups flagged")
+
+        # Build all task tables in one scan, recordings of tasks with rounds are assigned to their round
+        for table, rows in build_task_tables(conn, tasks, max_round_duration).items():
+            logging.info(f"Created {table} with {rows} rows in {temp_db}")
+
+        events = build_ball_events(conn)
+        logging.info(f"Created {EVENTS_TABLE} with {events} events in {temp_db}")
+    except sqlite3.Error as e:
+        logging.error(f"Error building the task tables in {temp_db}: {str(e)}")
+        conn.close()
+        os.remove(temp_db)
+        return None
+    finally:
+        conn.close()
+
+    if parquet_dir:
+        export_parquet(temp_db, [task.table for task in tasks], parquet_dir)
+
+    return temp_db
+
+
+def process_databases(max_workers=None, full_rebuild=False, max_round_duration=None, parquet_dir=None,
+                      write_sqlite=True, resample_rate=RESAMPLE_RATE, round_seconds=ROUND_SECONDS, clean=False):
     """
     Main function to process all databases.
+
+    Pairs that were merged before and whose files did not change since are skipped, new or changed pairs
+    are appended to the final database. The manifest table in the final database records what was merged.
+
+    Args:
+        max_workers (int): Number of worker processes merging pairs in parallel (default: number of CPUs)
+        full_rebuild (bool): Delete the final database and merge all pairs again
+        max_round_duration (float): Leave out recordings more than this many seconds before the end of their round
+        parquet_dir (str): Also export the task tables as Parquet partitioned by task and session to this directory
+        write_sqlite (bool): Merge into the final database, without it all pairs are only exported as Parquet
+        resample_rate (float): Samples per second of the resampled rounds
+        round_seconds (float): Length of the resampled rounds in seconds
+        clean (bool): Remove duplicate recordings, impossible heart rates and rr artifacts from the task tables
     """
+    final_db = "final_merged.sqlite3"
+    resampled_store = "resampled_series.npy"
+    session_store = "session_store.bin"
+
     # Get paired databases
     pairs = get_paired_databases('data')
     if not pairs:
         logging.error("No paired databases found!")
         return
 
-    # Create temporary databases for each pair
-    temp_dbs = []
-    for i, (otree_db, hr_db) in enumerate(pairs):
-        temp_db = f"temp_merged_{i}.sqlite3"
-        temp_dbs.append(temp_db)
-
-        # Merge pair into temporary database
-        logging.info(f"\nProcessing pair {i + 1}: {otree_db.name} and {hr_db.name}")
-        merge_pair_to_temp(otree_db, hr_db, temp_db)
+    if parquet_dir:
+        # Fail before merging anything if pyarrow is missing
+        import_pyarrow()
 
-        # Execute create_tables.sql on temporary database
-        execute_sql_script(temp_db, 'create_tables.sql')
-
-    # Merge all temporary databases into final database
-    final_db = "final_merged.sqlite3"
-    logging.info("\nCreating final merged database...")
-    merge_final_tables(temp_dbs, final_db)
-
-    # Clean up temporary databases
-    for temp_db in temp_dbs:
-        if os.path.exists(temp_db):
-            os.remove(temp_db)
-            logging.info(f"Removed temporary database: {temp_db}")
-
-    logging.info("\nDatabase merge completed successfully!")
-    logging.info(f"Final database: {final_db}")
+    if full_rebuild and write_sqlite and os.path.exists(final_db):
+        os.remove(final_db)
+        logging.info(f"Removed {final_db} for a full rebuild")
+
+    # Only merge pairs that are new or changed since the last merge
+    manifest = read_manifest(final_db) if write_sqlite else {}
+    pending_pairs = []
+    manifest_entries = []
+    for otree_db, hr_db in pairs:
+        previous = manifest.get((otree_db.name, hr_db.name))
+        entry = manifest_entry(otree_db, hr_db, previous)
+        if pair_is_unchanged(entry, previous):
+            logging.info(f"Skipping unchanged pair: {otree_db.name} <-> {hr_db.name}")
+            continue
+        # The task tables carry the session codes of both databases, sessions only in the HR database included
+        session_codes = set(read_session_codes(otree_db)) | set(read_hr_session_codes(hr_db))
+        entry['session_codes'] = json.dumps(sorted(session_codes))
+        pending_pairs.append((otree_db, hr_db))
+        manifest_entries.append(entry)
+
+    # The task tables are defined by the apps of the experiment
+    tasks = discover_tasks()
+    tables = [task.table for task in tasks]
+    logging.info(f"Task tables: {', '.join(f'{task.table} ({task.app_name})' for task in tasks)}")
+
+    if pending_pairs:
+        # Create temporary databases for each pair, pairs are independent and processed in parallel.
+        # Without the final database every pair exports its own sessions.
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            temp_dbs = list(executor.map(
+                process_pair,
+                range(len(pending_pairs)),
+                [otree_db for otree_db, _ in pending_pairs],
+                [hr_db for _, hr_db in pending_pairs],
+                [tasks] * len(pending_pairs),
+                [max_round_duration] * len(pending_pairs),
+                [None if write_sqlite else parquet_dir] * len(pending_pairs),
+                [clean] * len(pending_pairs),
+            ))
+
+        # Failed pairs get no manifest entry, so the next run merges them again
+        for (otree_db, hr_db), temp_db in zip(pending_pairs, temp_dbs):
+            if temp_db is None:
+                logging.error(f"Leaving out pair {otree_db.name} <-> {hr_db.name}, its task tables could not be built")
+        manifest_entries = [entry for entry, temp_db in zip(manifest_entries, temp_dbs) if temp_db is not None]
+        temp_dbs = [temp_db for temp_db in temp_dbs if temp_db is not None]
+
+        # Merge all temporary databases into final database
+        if write_sqlite:
+            logging.info(f"\nMerging {len(temp_dbs)} of {len(pairs)} pairs into the final database...")
+            merge_final_tables(temp_dbs, final_db, tables + [QUALITY_TABLE, EVENTS_TABLE], manifest_entries)
+            index_ball_events(final_db)
+
+            # Recompute the HRV features of the merged sessions
+            session_codes = None if full_rebuild else sorted({
+                code for entry in manifest_entries for code in json.loads(entry['session_codes'])
+            })
+            windows = compute_hrv_features(final_db, tables, session_codes)
+            logging.info(f"Computed HRV features of {windows} windows")
+
+        # Clean up temporary databases
+        for temp_db in temp_dbs:
+            if os.path.exists(temp_db):
+                os.remove(temp_db)
+                logging.info(f"Removed temporary database: {temp_db}")
+
+        logging.info("\nDatabase merge completed successfully!")
+    else:
+        logging.info(f"\nAll pairs are already merged, {final_db} is up to date")
+
+    if write_sqlite:
+        logging.info(f"Final database: {final_db}")
+        # Also after runs without new pairs, so changed rates take effect
+        stored = write_resampled_series(final_db, tasks, resampled_store, resample_rate, round_seconds)
+        logging.info(f"Resampled {stored} rounds into {resampled_store}")
+        samples = write_session_store(final_db, tasks, session_store)
+        logging.info(f"Stored {samples} samples in {session_store}")
+        if parquet_dir:
+            # The final database also has the rows of the pairs skipped above
+            export_parquet(final_db, tables, parquet_dir)
+    if parquet_dir:
+        logging.info(f"Parquet export: {parquet_dir}")
 
 
 if __name__ == "__main__":
-    process_databases()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Merge oTree and HR databases into the final task tables')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of pairs merged in parallel (default: number of CPUs)')
+    parser.add_argument('-f', '--full-rebuild', action='store_true',
+                        help='merge all pairs again instead of only new or changed ones')
+
+    parser.add_argument('-m', '--max-round-duration', type=float, default=None,
+                        help='leave out recordings more than this many seconds before the end of their round '
+                             '(e.g. 60 for the task rounds; changing it needs --full-rebuild)')
+
+    parser.add_argument('-p', '--parquet', metavar='DIR', default=None,
+                        help='also export the task tables as Parquet partitioned by task and session (needs pyarrow)')
+    parser.add_argument('--no-sqlite', action='store_true',
+                        help='only export Parquet and do not write the final SQLite database')
+
+    parser.add_argument('-r', '--resample-rate', type=float, default=RESAMPLE_RATE,
+                        help=f'samples per second of the resampled rounds (default: {RESAMPLE_RATE})')
+    parser.add_argument('--round-seconds', type=float, default=ROUND_SECONDS,
+                        help=f'length of the resampled rounds in seconds (default: {ROUND_SECONDS})')
+    parser.add_argument('--clean', action='store_true',
+                        help='remove duplicate recordings, impossible heart rates and rr artifacts found by the '
+                             'quality check from the task tables (changing it needs --full-rebuild)')
+
+    args = parser.parse_args()
+    if args.no_sqlite and not args.parquet:
+        parser.error('--no-sqlite needs --parquet')
+    process_databases(max_workers=args.workers, full_rebuild=args.full_rebuild,
+                      max_round_duration=args.max_round_duration, parquet_dir=args.parquet,
+                      write_sqlite=not args.no_sqlite, resample_rate=args.resample_rate,
+                      round_seconds=args.round_seconds, clean=args.clean)
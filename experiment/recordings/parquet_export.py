@@ -0,0 +1,124 @@
+"""
+Exports the task tables as Parquet files partitioned by task and session.
+
+Every task table gets its own directory with one hive-style partition per session:
+
+    <export_dir>/math_task_table/session_code=<code>/part-0.parquet
+
+so a single task or session can be read without parsing the others, e.g. arrow::open_dataset() in R. Columns are
+typed: time_recorded is a UTC timestamp, heart_rate and round_number are integers and rr_intervalls is a list of
+integers instead of JSON text.
+
+Requires pyarrow (pip install pyarrow), which is only imported when exporting.
+"""
+
+
+import json
+import logging
+import shutil
+import sqlite3
+from pathlib import Path
+
+from frisbee_base import parse_time_recorded
+
+PARTITION_FILE = 'part-0.parquet'
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("The Parquet export requires pyarrow, install it with 'pip install pyarrow'") from e
+    return pyarrow, pyarrow.parquet
+
+
+def task_table_schema(pa, has_rounds):
+    fields = [
+        pa.field('label', pa.string()),
+        pa.field('current_app_name', pa.string()),
+        pa.field('heart_rate', pa.int16()),
+        pa.field('rr_intervalls', pa.list_(pa.int32())),
+        pa.field('time_recorded', pa.timestamp('us', tz='UTC')),
+    ]
+    if has_rounds:
+        fields.insert(2, pa.field('round_number', pa.int16()))
+    return pa.schema(fields)
+
+
+def parse_rr_intervalls(value):
+    if value is None:
+        return None
+    rr_intervals = json.loads(value)
+    return rr_intervals if isinstance(rr_intervals, list) else None
+
+
+def export_task_table(conn, table, export_dir):
+    """
+    Writes one partition per session of a task table, replacing partitions of earlier exports.
+
+    Args:
+        conn (sqlite3.Connection): Connection to a database with the task table
+        table (str): Name of the task table
+        export_dir (Path): Root directory of the export
+
+    Returns:
+        int: Number of exported rows
+    """
+    pa, pq = import_pyarrow()
+
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if not columns:
+        logging.error(f"Error exporting {table}: no such table")
+        return 0
+    has_rounds = 'round_number' in columns
+    # Final databases merged before time_recorded_epoch existed only have the text column
+    time_column = 'time_recorded_epoch' if 'time_recorded_epoch' in columns else 'time_recorded'
+    schema = task_table_schema(pa, has_rounds)
+
+    session_codes = [code for code, in conn.execute(f"SELECT DISTINCT session_code FROM {table}")]
+    exported = 0
+    for session_code in session_codes:
+        rows = conn.execute(f"""
+            SELECT label, current_app_name, {'round_number, ' if has_rounds else ''}
+                   heart_rate, rr_intervalls, {time_column}
+            FROM {table}
+            WHERE session_code IS ?
+            ORDER BY label, {time_column}
+        """, (session_code,)).fetchall()
+
+        data = dict(zip(schema.names, zip(*rows))) if rows else {name: () for name in schema.names}
+        data['rr_intervalls'] = [parse_rr_intervalls(value) for value in data['rr_intervalls']]
+        # Stored as microseconds since the epoch
+        epochs = [parse_time_recorded(value) for value in data['time_recorded']]
+        data['time_recorded'] = [round(epoch * 1_000_000) if epoch is not None else None for epoch in epochs]
+        arrow_table = pa.Table.from_pydict(data, schema=schema)
+
+        partition_dir = Path(export_dir) / table / f"session_code={session_code}"
+        if partition_dir.exists():
+            shutil.rmtree(partition_dir)
+        partition_dir.mkdir(parents=True)
+        pq.write_table(arrow_table, partition_dir / PARTITION_FILE, compression='zstd')
+        exported += len(rows)
+
+    return exported
+
+
+def export_parquet(db_path, tables, export_dir):
+    """
+    Exports task tables of a database as partitioned Parquet.
+
+    Args:
+        db_path (str): Path to a temporary or the final merged database
+        tables (list): Names of the task tables
+        export_dir (str): Root directory of the export
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for table in tables:
+            rows = export_task_table(conn, table, export_dir)
+            logging.info(f"Exported {rows} rows of {table} from {db_path} to {export_dir}")
+    except sqlite3.Error as e:
+        logging.error(f"Error exporting {db_path}: {str(e)}")
+    finally:
+        conn.close()
@@ -0,0 +1,220 @@
+"""
+Checks the recordings in frisbee_base for artifacts and writes one quality_report row per participant and app.
+
+The checks run on NumPy arrays of all recordings of a database at once, sorted by session_code, label, app and time,
+so consecutive differences are taken in one pass and summed per participant and app with bincount:
+
+    gaps                  no recording for more than GAP_SECONDS within one recording window, i.e. on the same
+                          page in the same round. Rounds end at the timestamps of the round results like in
+                          interval_join, so the pause between the Task pages of two rounds is not a gap
+    duplicate_timestamps  recordings with the same time as the recording before
+    heart_rate_*          missing heart rates and heart rates outside HEART_RATE_RANGE (bpm)
+    rr_out_of_range       rr intervals outside RR_RANGE (ms)
+    rr_ectopic            rr intervals differing more than ECTOPIC_RATIO from the interval before (Malik criterion)
+
+flags lists the checks a recording failed, rr artifacts only count once they exceed MAX_RR_ARTIFACT_SHARE because a
+few ectopic beats are normal. With clean, the artifacts are also removed from frisbee_base before the task tables are
+built: duplicate recordings are deleted, impossible heart rates set to NULL and rr artifacts dropped.
+"""
+
+
+import json
+import logging
+
+import numpy as np
+
+from interval_join import read_round_ends
+
+QUALITY_TABLE = 'quality_report'
+GAP_SECONDS = 5.0
+HEART_RATE_RANGE = (30, 220)
+RR_RANGE = (300, 2000)
+ECTOPIC_RATIO = 0.2
+MAX_RR_ARTIFACT_SHARE = 0.05
+
+REPORT_COLUMNS = [
+    'session_code TEXT', 'label TEXT', 'app TEXT', 'samples INTEGER', 'first_epoch REAL', 'last_epoch REAL',
+    'gaps INTEGER', 'gap_seconds REAL', 'max_gap_seconds REAL', 'duplicate_timestamps INTEGER',
+    'heart_rate_missing INTEGER', 'heart_rate_out_of_range INTEGER', 'rr_intervals INTEGER',
+    'rr_out_of_range INTEGER', 'rr_ectopic INTEGER', 'flags TEXT', 'cleaned INTEGER',
+]
+
+
+def group_starts(*keys):
+    """True where a row starts a new group of the sorted key columns."""
+    starts = np.zeros(len(keys[0]), dtype=bool)
+    starts[:1] = True
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+    return starts
+
+
+def rr_artifacts(rr, groups):
+    """
+    Finds the rr artifacts of all recordings.
+
+    Args:
+        rr (numpy.ndarray): rr intervals in ms in the order they were recorded, NaN if missing
+        groups (numpy.ndarray): Group of every interval, intervals of a group are consecutive
+
+    Returns:
+        tuple: (out_of_range, ectopic) boolean masks
+    """
+    out_of_range = ~((rr >= RR_RANGE[0]) & (rr <= RR_RANGE[1]))
+
+    # Compare every valid interval with the valid interval before it in the same group
+    valid = np.flatnonzero(~out_of_range)
+    previous, current = valid[:-1], valid[1:]
+    same_group = groups[previous] == groups[current]
+    ratio = np.abs(rr[current] - rr[previous]) / rr[previous]
+    ectopic = np.zeros(len(rr), dtype=bool)
+    ectopic[current[same_group & (ratio > ECTOPIC_RATIO)]] = True
+    return out_of_range, ectopic
+
+
+def check_quality(conn, tasks, clean=False):
+    """
+    Writes the quality_report table of the recordings in frisbee_base.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the merged database with frisbee_base and frisbee_rr_intervals
+        tasks (list): Tasks of the task registry, their round ends split the recordings into recording windows
+        clean (bool): Also remove the artifacts from frisbee_base
+
+    Returns:
+        int: Number of participant/app groups with flags
+    """
+    rows = conn.execute("""
+        SELECT id, session_code, label, current_app_name, current_page_name, time_recorded_epoch, heart_rate
+        FROM frisbee_base
+        WHERE time_recorded_epoch IS NOT NULL
+        ORDER BY session_code, label, current_app_name, time_recorded_epoch, id
+    """).fetchall()
+    conn.execute(f"DROP TABLE IF EXISTS {QUALITY_TABLE}")
+    conn.execute(f"CREATE TABLE {QUALITY_TABLE} ({', '.join(REPORT_COLUMNS)})")
+    if not rows:
+        return 0
+
+    ids, session_codes, labels, apps, pages, times, heart_rates = (np.array(column) for column in zip(*rows))
+    times = times.astype(float)
+    heart_rates = np.array([np.nan if value is None else value for value in heart_rates], dtype=float)
+
+    starts = group_starts(session_codes, labels, apps)
+    groups = np.cumsum(starts) - 1
+    group_count = groups[-1] + 1
+
+    first_rows = np.flatnonzero(starts)
+    last_rows = np.append(first_rows[1:] - 1, len(rows) - 1)
+
+    def per_group(values, weights=None):
+        return np.bincount(values, weights=weights, minlength=group_count)
+
+    # Round of every recording of a task with rounds, a round is (previous round end, round end]
+    rounds = np.zeros(len(rows), dtype=int)
+    round_ends = {
+        task.app_name: read_round_ends(conn, task.results_table, task.player_table)
+        for task in tasks if task.has_rounds
+    }
+    for first, last in zip(first_rows, last_rows):
+        participant_round_ends = round_ends.get(apps[first], {}).get((labels[first], session_codes[first]))
+        if participant_round_ends:
+            ends = [round_end for round_end, _ in participant_round_ends]
+            rounds[first:last + 1] = np.searchsorted(ends, times[first:last + 1], side='left')
+
+    # Differences to the recording before in the same group, gaps only count within one recording window
+    deltas = np.diff(times, prepend=np.nan)
+    deltas[starts] = np.nan
+    same_window = np.concatenate(([False], (pages[1:] == pages[:-1]) & (rounds[1:] == rounds[:-1]))) & ~starts
+    gaps = same_window & (deltas > GAP_SECONDS)
+    duplicates = deltas == 0
+    heart_rate_missing = np.isnan(heart_rates)
+    heart_rate_out_of_range = ~heart_rate_missing & (
+        (heart_rates < HEART_RATE_RANGE[0]) | (heart_rates > HEART_RATE_RANGE[1])
+    )
+    max_gaps = np.zeros(group_count)
+    np.maximum.at(max_gaps, groups[same_window], deltas[same_window])
+
+    # rr intervals in the order of their recordings, the sorter maps their sample ids to rows
+    rr_rows = conn.execute("""
+        SELECT r.sample_id, r.position, r.rr_interval
+        FROM frisbee_rr_intervals r
+        JOIN frisbee_base b ON b.id = r.sample_id
+        WHERE b.time_recorded_epoch IS NOT NULL
+        ORDER BY b.session_code, b.label, b.current_app_name, b.time_recorded_epoch, b.id, r.position
+    """).fetchall()
+    if rr_rows:
+        rr_sample_ids, rr_positions, rr = (np.array(column) for column in zip(*rr_rows))
+        rr = np.array([np.nan if value is None else value for value in rr], dtype=float)
+        sorter = np.argsort(ids)
+        rr_groups = groups[sorter[np.searchsorted(ids, rr_sample_ids, sorter=sorter)]]
+        rr_out_of_range, rr_ectopic = rr_artifacts(rr, rr_groups)
+    else:
+        rr_sample_ids = rr_positions = np.empty(0, dtype=int)
+        rr_groups = np.empty(0, dtype=int)
+        rr_out_of_range = rr_ectopic = np.empty(0, dtype=bool)
+
+    counts = {
+        'samples': per_group(groups),
+        'gaps': per_group(groups[gaps]),
+        'gap_seconds': per_group(groups[gaps], deltas[gaps]),
+        'duplicate_timestamps': per_group(groups[duplicates]),
+        'heart_rate_missing': per_group(groups[heart_rate_missing]),
+        'heart_rate_out_of_range': per_group(groups[heart_rate_out_of_range]),
+        'rr_intervals': per_group(rr_groups),
+        'rr_out_of_range': per_group(rr_groups[rr_out_of_range]),
+        'rr_ectopic': per_group(rr_groups[rr_ectopic]),
+    }
+    report_rows = []
+    for group, row in enumerate(first_rows):
+        flags = [
+            name for name, failed in [
+                ('gaps', counts['gaps'][group] > 0),
+                ('duplicates', counts['duplicate_timestamps'][group] > 0),
+                ('heart_rate', counts['heart_rate_out_of_range'][group] > 0),
+                ('rr_artifacts', counts['rr_out_of_range'][group] + counts['rr_ectopic'][group]
+                 > MAX_RR_ARTIFACT_SHARE * counts['rr_intervals'][group]),
+            ] if failed
+        ]
+        report_rows.append((
+            session_codes[row], labels[row], apps[row], int(counts['samples'][group]), times[row],
+            times[last_rows[group]], int(counts['gaps'][group]), float(counts['gap_seconds'][group]),
+            float(max_gaps[group]), int(counts['duplicate_timestamps'][group]),
+            int(counts['heart_rate_missing'][group]), int(counts['heart_rate_out_of_range'][group]),
+            int(counts['rr_intervals'][group]), int(counts['rr_out_of_range'][group]),
+            int(counts['rr_ectopic'][group]), ','.join(flags) or None, int(clean),
+        ))
+
+    with conn:
+        conn.executemany(f"INSERT INTO {QUALITY_TABLE} VALUES ({', '.join('?' for _ in REPORT_COLUMNS)})",
+                         report_rows)
+        if clean:
+            clean_frisbee_base(conn, ids[duplicates], ids[heart_rate_out_of_range],
+                               rr_sample_ids[rr_out_of_range | rr_ectopic], rr_positions[rr_out_of_range | rr_ectopic])
+
+    flagged = [row for row in report_rows if row[-2]]
+    for row in flagged:
+        logging.warning(f"Quality of {row[1]} in {row[2]} of session {row[0]}: {row[-2]}")
+    return len(flagged)
+
+
+def clean_frisbee_base(conn, duplicate_ids, heart_rate_ids, rr_sample_ids, rr_positions):
+    """Removes the artifacts found by check_quality() from frisbee_base and frisbee_rr_intervals."""
+    duplicate_ids = [(int(sample_id),) for sample_id in duplicate_ids]
+    conn.executemany("DELETE FROM frisbee_rr_intervals WHERE sample_id = ?", duplicate_ids)
+    conn.executemany("DELETE FROM frisbee_base WHERE id = ?", duplicate_ids)
+    conn.executemany("UPDATE frisbee_base SET heart_rate = NULL WHERE id = ?",
+                     [(int(sample_id),) for sample_id in heart_rate_ids])
+
+    conn.executemany("DELETE FROM frisbee_rr_intervals WHERE sample_id = ? AND position = ?",
+                     [(int(sample_id), int(position)) for sample_id, position in zip(rr_sample_ids, rr_positions)])
+    # The task tables read the rr intervals as JSON text, rewrite it from the remaining intervals
+    changed = sorted(set(map(int, rr_sample_ids)) - {sample_id for sample_id, in duplicate_ids})
+    for sample_id in changed:
+        remaining = [rr for rr, in conn.execute(
+            "SELECT rr_interval FROM frisbee_rr_intervals WHERE sample_id = ? ORDER BY position", (sample_id,)
+        )]
+        conn.execute("UPDATE frisbee_base SET rr_intervalls = ? WHERE id = ?",
+                     (json.dumps(remaining, separators=(',', ':')), sample_id))
+
+    logging.info(f"Cleaned frisbee_base: {len(duplicate_ids)} duplicate recordings, {len(heart_rate_ids)} heart rates "
+                 f"out of range, {len(rr_positions)} rr artifacts")
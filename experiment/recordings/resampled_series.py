@@ -0,0 +1,119 @@
+"""
+Resamples the heart rate of every round to a fixed rate and duration and z-normalizes it.
+
+All rounds become float32 arrays of the same length, stored as the rows of one .npy file that can be opened as a
+memory map (numpy.load(path, mmap_mode='r')). The resampled_series table of the final database is the index:
+
+    row            row of the round in the .npy file
+    session_code, label, task, round_number
+    start_epoch    POSIX time of the first sample, the grid starts there
+    sample_rate    samples per second of the grid
+    samples        recordings the row was interpolated from
+    coverage       share of the grid covered by recordings, rows of rounds that ended early repeat the last value
+
+Like the analysis notebook the series are z-normalized per participant and round, but after resampling, so every
+row has mean 0 and standard deviation 1.
+"""
+
+
+import itertools
+import logging
+import os
+import sqlite3
+
+import numpy as np
+
+RESAMPLE_RATE = 1.0
+ROUND_SECONDS = 60
+INDEX_TABLE = 'resampled_series'
+INDEX_COLUMNS = ['row INTEGER PRIMARY KEY', 'session_code TEXT', 'label TEXT', 'task TEXT', 'round_number INTEGER',
+                 'start_epoch REAL', 'sample_rate REAL', 'samples INTEGER', 'coverage REAL']
+
+
+def resample_round(times, heart_rates, sample_rate=RESAMPLE_RATE, round_seconds=ROUND_SECONDS):
+    """
+    Interpolates one round onto a grid starting at its first recording.
+
+    Args:
+        times (numpy.ndarray): POSIX timestamps of the recordings, ascending
+        heart_rates (numpy.ndarray): Heart rate of every recording
+        sample_rate (float): Samples per second of the grid
+        round_seconds (float): Length of the grid in seconds, later recordings are left out
+
+    Returns:
+        tuple: (z-normalized float32 array, coverage), None instead of the array if the round is constant
+    """
+    length = int(round(round_seconds * sample_rate))
+    grid = times[0] + np.arange(length) / sample_rate
+    values = np.interp(grid, times, heart_rates)
+    coverage = min(1.0, (times[-1] - times[0] + 1 / sample_rate) / round_seconds)
+
+    sd = values.std(ddof=1)
+    if not sd > 0:
+        return None, coverage
+    return ((values - values.mean()) / sd).astype(np.float32), coverage
+
+
+def write_resampled_series(db_path, tasks, store_path, sample_rate=RESAMPLE_RATE, round_seconds=ROUND_SECONDS):
+    """
+    Writes the resampled rounds of all tasks with rounds to store_path and indexes them in the final database.
+
+    Args:
+        db_path (str): Path to the final merged database
+        tasks (list): Tasks of the task registry, tasks without rounds are left out
+        store_path (str): Path of the .npy file
+        sample_rate (float): Samples per second
+        round_seconds (float): Length of every series in seconds
+
+    Returns:
+        int: Number of stored rounds
+    """
+    conn = sqlite3.connect(db_path)
+    arrays = []
+    index_rows = []
+    skipped = 0
+    try:
+        for task in tasks:
+            if not task.has_rounds:
+                continue
+            rows = conn.execute(f"""
+                SELECT session_code, label, round_number, time_recorded_epoch, heart_rate
+                FROM {task.table}
+                WHERE heart_rate IS NOT NULL AND time_recorded_epoch IS NOT NULL
+                ORDER BY session_code, label, round_number, time_recorded_epoch
+            """)
+            for (session_code, label, round_number), round_rows in itertools.groupby(rows, key=lambda row: row[:3]):
+                samples = np.array([row[3:] for row in round_rows], dtype=float)
+                if len(samples) < 2:
+                    skipped += 1
+                    continue
+                values, coverage = resample_round(samples[:, 0], samples[:, 1], sample_rate, round_seconds)
+                if values is None:
+                    skipped += 1
+                    continue
+                index_rows.append((len(arrays), session_code, label, task.app_name, round_number, samples[0, 0],
+                                   sample_rate, len(samples), coverage))
+                arrays.append(values)
+
+        length = int(round(round_seconds * sample_rate))
+        store = np.stack(arrays) if arrays else np.empty((0, length), dtype=np.float32)
+        # Replace the file in one step so readers never map a partly written store
+        temp_path = f"{store_path}.tmp.npy"
+        np.save(temp_path, store)
+        os.replace(temp_path, store_path)
+
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+            conn.execute(f"CREATE TABLE {INDEX_TABLE} ({', '.join(INDEX_COLUMNS)})")
+            conn.executemany(f"INSERT INTO {INDEX_TABLE} VALUES ({', '.join('?' for _ in INDEX_COLUMNS)})",
+                             index_rows)
+
+    except sqlite3.Error as e:
+        logging.error(f"Error resampling the rounds of {db_path}: {str(e)}")
+
+    finally:
+        conn.close()
+
+    if skipped:
+        logging.info(f"Left out {skipped} rounds with fewer than 2 recordings or a constant heart rate")
+    return len(index_rows)
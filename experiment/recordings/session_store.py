@@ -0,0 +1,173 @@
+"""
+Stores all heart rate samples of the task tables in one memory-mapped column file.
+
+Reading one participant's round from the task tables means querying and parsing rows, the store instead keeps every
+column as one contiguous array, sorted by session_code, label, app, round and time. Its header indexes where each
+(session_code, label, app, round_number) segment starts and ends, so SessionStore.segment() slices a segment out of
+the memory map in O(1) and only the pages of that segment are read from disk.
+
+Layout, every column starts at a multiple of ALIGNMENT:
+
+    magic          b'FBSTORE1'
+    header size    uint64, little endian
+    header         JSON: columns (offset, dtype, length) and segments [session_code, label, app, round_number,
+                   start, stop] with the sample range of each segment
+    time           float64  POSIX time of every sample
+    heart_rate     int16    -1 if the sample has none
+    rr_offsets     int64    samples + 1 offsets into rr_intervals, the rr intervals of sample i are
+                            rr_intervals[rr_offsets[i]:rr_offsets[i + 1]]
+    rr_intervals   uint16   ms
+"""
+
+
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+from hrv_features import parse_rr_intervalls
+
+MAGIC = b'FBSTORE1'
+ALIGNMENT = 64
+COLUMNS = {
+    'time': '<f8',
+    'heart_rate': '<i2',
+    'rr_offsets': '<i8',
+    'rr_intervals': '<u2',
+}
+MISSING_HEART_RATE = -1
+
+
+@dataclass(frozen=True)
+class Segment:
+    time: np.ndarray
+    heart_rate: np.ndarray
+    rr_offsets: np.ndarray  # relative to rr_intervals of the segment
+    rr_intervals: np.ndarray
+
+    def rr_intervals_of(self, sample):
+        return self.rr_intervals[self.rr_offsets[sample]:self.rr_offsets[sample + 1]]
+
+
+class SessionStore:
+    """Read access to a store written by write_session_store()."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as store_file:
+            magic, header_size = struct.unpack('<8sQ', store_file.read(16))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a session store")
+            header = json.loads(store_file.read(header_size))
+
+        self.columns = {
+            name: np.memmap(path, dtype=column['dtype'], mode='r', offset=column['offset'], shape=(column['length'],))
+            if column['length'] else np.empty(0, dtype=column['dtype'])
+            for name, column in header['columns'].items()
+        }
+        self.index = {
+            (session_code, label, app, round_number): (start, stop)
+            for session_code, label, app, round_number, start, stop in header['segments']
+        }
+
+    def keys(self):
+        """(session_code, label, app, round_number) of all segments, round_number is None for tasks without rounds."""
+        return self.index.keys()
+
+    def segment(self, session_code, label, app, round_number=None):
+        """Samples of one participant in one round (or task without rounds), KeyError if there are none."""
+        start, stop = self.index[session_code, label, app, round_number]
+        rr_offsets = self.columns['rr_offsets'][start:stop + 1]
+        return Segment(
+            time=self.columns['time'][start:stop],
+            heart_rate=self.columns['heart_rate'][start:stop],
+            rr_offsets=rr_offsets - rr_offsets[0],
+            rr_intervals=self.columns['rr_intervals'][rr_offsets[0]:rr_offsets[-1]],
+        )
+
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_session_store(db_path, tasks, store_path):
+    """
+    Writes the samples of all task tables of the final database to store_path.
+
+    Args:
+        db_path (str): Path to the final merged database
+        tasks (list): Tasks of the task registry
+        store_path (str): Path of the store file
+
+    Returns:
+        int: Number of stored samples
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    times, heart_rates, rr_counts, rr_intervals = [], [], [], []
+    segments = []
+    try:
+        for task in tasks:
+            round_column = 'round_number' if task.has_rounds else 'NULL'
+            rows = conn.execute(f"""
+                SELECT session_code, label, {round_column}, time_recorded_epoch, heart_rate, rr_intervalls
+                FROM {task.table}
+                WHERE time_recorded_epoch IS NOT NULL
+                ORDER BY session_code, label, {round_column}, time_recorded_epoch
+            """)
+            for (session_code, label, round_number), segment_rows in itertools.groupby(rows, key=lambda row: row[:3]):
+                start = len(times)
+                for _, _, _, time_recorded, heart_rate, rr_intervalls in segment_rows:
+                    rr = [value for value in parse_rr_intervalls(rr_intervalls) if 0 < value <= 0xFFFF]
+                    times.append(time_recorded)
+                    heart_rates.append(MISSING_HEART_RATE if heart_rate is None else heart_rate)
+                    rr_counts.append(len(rr))
+                    rr_intervals.extend(rr)
+                segments.append([session_code, label, task.app_name, round_number, start, len(times)])
+    except sqlite3.Error as e:
+        logging.error(f"Error reading the samples of {db_path}: {str(e)}")
+        return 0
+    finally:
+        conn.close()
+
+    arrays = {
+        'time': np.array(times, dtype=COLUMNS['time']),
+        'heart_rate': np.array(heart_rates, dtype=COLUMNS['heart_rate']),
+        'rr_offsets': np.concatenate(([0], np.cumsum(rr_counts, dtype=np.int64))).astype(COLUMNS['rr_offsets']),
+        'rr_intervals': np.array(rr_intervals, dtype=COLUMNS['rr_intervals']),
+    }
+
+    # The column offsets depend on the header size and the header holds the offsets, so reserve room for the
+    # largest offsets first
+    def header_bytes(offsets):
+        return json.dumps({
+            'columns': {
+                name: {'offset': offsets[name], 'dtype': COLUMNS[name], 'length': len(array)}
+                for name, array in arrays.items()
+            },
+            'segments': segments,
+        }).encode()
+
+    header_size = len(header_bytes(dict.fromkeys(arrays, 2 ** 63 - 1)))
+    offsets = {}
+    position = aligned(16 + header_size)
+    for name, array in arrays.items():
+        offsets[name] = position
+        position = aligned(position + array.nbytes)
+    header = header_bytes(offsets).ljust(header_size)
+
+    # Replace the file in one step so readers never map a partly written store
+    temp_path = f"{store_path}.tmp"
+    with open(temp_path, 'wb') as store_file:
+        store_file.write(struct.pack('<8sQ', MAGIC, header_size))
+        store_file.write(header)
+        for name, array in arrays.items():
+            store_file.seek(offsets[name])
+            store_file.write(array.tobytes())
+        store_file.truncate(position)
+    os.replace(temp_path, store_path)
+
+    return len(times)
@@ -0,0 +1,94 @@
+"""
+Discovers the tasks whose heart rate recordings end up in a task table.
+
+The apps are taken from the app_sequence of the session configs in settings.py. An app is a task if one of its pages
+is decorated with @server.map_frisbee_data. If the app also has an ExtraModel with a round_number and a timestamp
+field (like MathRoundResults), the timestamps mark the end of each round and the task table gets a round_number.
+The app modules are parsed, not imported, so oTree does not have to be installed.
+"""
+
+
+import ast
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+EXPERIMENT_DIR = Path(__file__).resolve().parent.parent
+
+# Task tables that do not follow the {app}_table naming
+TABLE_NAMES = {
+    'video_task_one': 'video_one_table',
+    'video_task_two': 'video_two_table',
+}
+
+
+@dataclass(frozen=True)
+class Task:
+    app_name: str
+    table: str
+    results_table: str | None = None  # oTree table of the round results ExtraModel
+    player_table: str | None = None
+
+    @property
+    def has_rounds(self) -> bool:
+        return self.results_table is not None
+
+
+def read_app_sequence(settings_path: Path) -> list[str]:
+    """Apps of all session configs in order of first appearance."""
+    tree = ast.parse(settings_path.read_text(encoding='utf-8'))
+    apps = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'dict'):
+            continue
+        for keyword in node.keywords:
+            if keyword.arg == 'app_sequence':
+                apps.extend(app for app in ast.literal_eval(keyword.value) if app not in apps)
+    return apps
+
+
+def is_frisbee_data_mapped(tree: ast.Module) -> bool:
+    return any(
+        isinstance(decorator, ast.Attribute) and decorator.attr == 'map_frisbee_data'
+        for node in ast.walk(tree) if isinstance(node, ast.ClassDef)
+        for decorator in node.decorator_list
+    )
+
+
+def find_round_results_model(tree: ast.Module) -> str | None:
+    """Name of the first ExtraModel with a round_number and a timestamp field."""
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        if not any(isinstance(base, ast.Name) and base.id == 'ExtraModel' for base in node.bases):
+            continue
+        fields = {
+            target.id
+            for statement in node.body if isinstance(statement, ast.Assign)
+            for target in statement.targets if isinstance(target, ast.Name)
+        }
+        if {'round_number', 'timestamp'} <= fields:
+            return node.name
+    return None
+
+
+def discover_tasks(experiment_dir: Path = EXPERIMENT_DIR) -> list[Task]:
+    tasks = []
+    for app_name in read_app_sequence(experiment_dir / 'settings.py'):
+        module_path = experiment_dir / app_name / '__init__.py'
+        if not module_path.is_file():
+            logging.warning(f"App {app_name} of the app_sequence has no {module_path}")
+            continue
+
+        tree = ast.parse(module_path.read_text(encoding='utf-8'))
+        if not is_frisbee_data_mapped(tree):
+            continue
+
+        table = TABLE_NAMES.get(app_name, f'{app_name}_table')
+        model = find_round_results_model(tree)
+        if model:
+            # oTree names the table of a model {app}_{model in lower case}
+            tasks.append(Task(app_name, table, f'{app_name}_{model.lower()}', f'{app_name}_player'))
+        else:
+            tasks.append(Task(app_name, table))
+    return tasks
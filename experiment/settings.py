@@ -42,7 +42,8 @@ ROOMS = [
     )
 ]
 
-PARTICIPANT_FIELDS = ['math_task_win_round', 'math_task_win_points', 'ball_task_win_round', 'ball_task_win_points']
+PARTICIPANT_FIELDS = ['math_task_win_round', 'math_task_win_points', 'ball_task_win_round', 'ball_task_win_points',
+                      'recording']
 SESSION_FIELDS = []
 
 # ISO-639 cod
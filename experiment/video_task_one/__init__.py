@@ -1,5 +1,6 @@
 from otree.api import *
 from frisbee.otree_extension.server_instance import server
+from recording import recording_window_model, start_recording, stop_recording
 
 doc = """
 This is the first relaxation video that will be 5 minutes long showing relaxing scenery
@@ -147,19 +148,20 @@ class Player(BasePlayer):
     )
 
 
+RecordingWindow = recording_window_model(Player)
+
+
 # PAGES
 @server.map_frisbee_data
 class Video(Page):
     @staticmethod
     def live_method(player: Player, data):
-        label = player.participant.label
         if data["type"] == "video_start":
-            server.start_recording(player, label)
+            start_recording(player)
 
     @staticmethod
     def before_next_page(player, timeout_happened):
-        label = player.participant.label
-        server.stop_recording(label)
+        stop_recording(player)
 
 
 class Introduction(Page):